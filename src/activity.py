@@ -0,0 +1,55 @@
+from src.turn_scheduler import get_action_delay
+
+
+class ActivityScheduler:
+    def __init__(self, wake_radius, sleep_radius, turn_scheduler=None):
+        """
+        Keeps track of which monsters are awake, so the enemy turn only visits those near the player
+         - monsters wake when the player comes within wake_radius of them, or when they hear a noise
+         - awake monsters fall dormant again once the player is more than sleep_radius away
+        Dormant monsters cost nothing: finding the ones to wake only looks at the entity buckets around the player
+        :param wake_radius: int distance (on both axes) monsters wake within, at least their sight radius
+        :param sleep_radius: int distance (on both axes) awake monsters fall dormant beyond
+        :param turn_scheduler: TurnScheduler object awake monsters are queued on, or None
+        """
+        self.wake_radius = wake_radius
+        self.sleep_radius = sleep_radius
+        self.turn_scheduler = turn_scheduler
+        # dict as an ordered set, so monsters always act in the same order
+        self.awake = {}
+    
+    def wake(self, entity):
+        if entity.ai and entity not in self.awake:
+            self.awake[entity] = None
+            if self.turn_scheduler is not None:
+                self.turn_scheduler.schedule(entity, get_action_delay(entity))
+    
+    def sleep(self, entity):
+        del self.awake[entity]
+        if self.turn_scheduler is not None:
+            self.turn_scheduler.unschedule(entity)
+    
+    def make_noise(self, x, y, radius, entities):
+        """
+        Wake every monster within radius tiles (on both axes) of a noise
+        :param x: x location of the noise
+        :param y: y location of the noise
+        :param radius: int distance the noise carries
+        :param entities: EntityList of Entity objects
+        :return: None
+        """
+        for entity in entities.get_near(x, y, radius):
+            self.wake(entity)
+    
+    def update(self, player, entities):
+        """
+        Wake monsters near the player, and put far away, dead or removed ones to sleep
+        :param player: player Entity object
+        :param entities: EntityList of Entity objects
+        :return: None
+        """
+        self.make_noise(player.x, player.y, self.wake_radius, entities)
+        for entity in list(self.awake):
+            if not entity.ai or entity.entity_list is not entities or \
+                    max(abs(entity.x - player.x), abs(entity.y - player.y)) > self.sleep_radius:
+                self.sleep(entity)
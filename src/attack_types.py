@@ -1,4 +1,4 @@
-import tcod as libtcod
+import numpy as np
 
 from src.game_messages import Message
 
@@ -83,48 +83,65 @@ def translational_tiles(direction, target_tiles):
     return translated_targets
 
 
-def remove_blocked_target_tiles(game_map, target_tiles, fov_map):
+# attack_type keys, in the order get_target_tiles checks them, and the function that builds each shape
+attack_shapes = [('line', get_line_tiles), ('direct', get_line_tiles), ('cone', get_cone_tiles)]
+
+# (shape, distance, direction) -> int array of (x, y) offsets from the attacker, built once on first use
+attack_templates = {}
+
+
+def get_attack_template(shape, distance, direction):
+    """
+    Offsets of an attack shape rotated to face one direction, from the template registry
+    :param shape: str attack_type key ('line', 'direct' or 'cone')
+    :param distance: int size of the shape
+    :param direction: tuple int x y direction the attack faces
+    :return: int array of (x, y) offsets from the attacker, shape (n, 2)
     """
-    removes blocked tiles, and tiles not in fov from attack zone
+    key = (shape, distance, direction)
+    template = attack_templates.get(key)
+    if template is None:
+        get_shape_tiles = dict(attack_shapes)[shape]
+        template = np.array(translational_tiles(direction, get_shape_tiles(distance)), dtype=np.int32).reshape(-1, 2)
+        attack_templates[key] = template
+    return template
+
+
+def remove_blocked_target_tiles(game_map, target_tiles, fov_cache):
+    """
+    removes blocked tiles, and tiles not in fov from attack zone (one lookup into the map and fov arrays for all tiles)
     :param game_map: GameMap object
-    :param target_tiles: tiles available to attack
-    :param fov_map: tiles that can be seen
-    :return: list of attackable tiles
+    :param target_tiles: int array of (x, y) tiles available to attack, shape (n, 2)
+    :param fov_cache: FovCache object holding the tiles that can be seen
+    :return: set of tuple int x y attackable tiles
     """
-    non_blocked = []
-    for (x, y) in target_tiles:
-        if not game_map.tiles[x][y].block_sight and libtcod.map_is_in_fov(m=fov_map, x=x, y=y):
-            non_blocked.append((x, y))
-    return non_blocked
+    (xs, ys) = target_tiles.T
+    on_map = (xs >= 0) & (xs < game_map.width) & (ys >= 0) & (ys < game_map.height)
+    xs, ys = xs[on_map], ys[on_map]
+    attackable = fov_cache.visible[xs, ys] & ~game_map.block_sight[xs, ys]
+    return set(zip(xs[attackable].tolist(), ys[attackable].tolist()))
 
 
-def get_target_tiles(entity, member, game_map, fov_map, attack_dir=None):
+def get_target_tiles(entity, member, game_map, fov_cache, attack_dir=None):
     """
     collects all tiles available to target, or only a subset in one direction
     :param entity: party doing the attacking
     :param member: int member of group that is attacking
     :param game_map: GameMap object
-    :param fov_map: list of visible tiles
+    :param fov_cache: FovCache object holding the tiles that can be seen
     :param attack_dir: int tuple of coordinates corresponding to attack direction
-    :return: list of attackable tiles
+    :return: set of tuple int x y attackable tiles
     """
     attack_type = entity.party.members[member].attack_type
-    target_tiles = []
+    shape = next((name for (name, get_shape_tiles) in attack_shapes if attack_type.get(name)), None)
+    if shape is None:
+        return set()
     if not attack_dir:
         attack_dir = directions
-    for direction in attack_dir:
-        if attack_type.get('line'):
-            dir_tiles = get_line_tiles(attack_type['line'])
-            target_tiles.extend(translational_tiles(direction, dir_tiles))
-        elif attack_type.get('direct'):
-            dir_tiles = get_line_tiles(attack_type['direct'])
-            target_tiles.extend(translational_tiles(direction, dir_tiles))
-        elif attack_type.get('cone'):
-            dir_tiles = get_cone_tiles(attack_type['cone'])
-            target_tiles.extend(translational_tiles(direction, dir_tiles))
-    target_tiles = relational_tiles((entity.x, entity.y), target_tiles)
-    target_tiles = remove_blocked_target_tiles(game_map, target_tiles, fov_map)
-    return target_tiles
+    target_tiles = np.concatenate([get_attack_template(shape, attack_type[shape], direction)
+                                   for direction in attack_dir])
+    target_tiles = target_tiles + np.array([entity.x, entity.y], dtype=np.int32)
+    return remove_blocked_target_tiles(game_map, target_tiles, fov_cache)
 
 
 # class ActionType:
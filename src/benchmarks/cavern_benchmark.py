@@ -0,0 +1,194 @@
+"""
+Stage by stage benchmark of the cavern generation pipeline (create_caverns)
+
+    python -m src.benchmarks.cavern_benchmark --output bench.json
+    python -m src.benchmarks.cavern_benchmark --sizes 80x43 --compare bench.json
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+
+from src.map_objects.caverns import LifeMap, cycle, cleanup, get_starting_seeds, make_zones, connect_caverns_mst
+
+SIZES = [(80, 43), (256, 256), (1024, 1024)]
+
+# survive_min, survive_max, resurrect_min, resurrect_max, iterations (from the comments in engine.main)
+PRESETS = {
+    'default': (3, 7, 6, 6, 4),
+    'good': (3, 6, 5, 6, 3),
+    'good_alt': (3, 6, 5, 7, 3),
+    'open': (3, 5, 5, 6, 4),
+    'forest': (2, 4, 6, 8, 6),
+    'windy': (3, 7, 5, 6, 4),
+}
+
+ZONE_SEED_MIN_DISTANCE = 10
+MIN_CAVERN_SIZE = 15
+
+
+def run_pipeline(map_width, map_height, preset, seed, measure):
+    """
+    Runs every stage of create_caverns in order, measuring each one
+    :param map_width: width of map
+    :param map_height: height of map
+    :param preset: tuple of life rules and iteration count, from PRESETS
+    :param seed: int random seed, so every run builds the same map
+    :param measure: function(stage name, function) that runs and measures one stage, returning its result
+    :return: None
+    """
+    (survive_min, survive_max, resurrect_min, resurrect_max, iterations) = preset
+    random.seed(seed)
+    
+    def make_random():
+        grid = LifeMap(map_width=map_width, map_height=map_height)
+        grid.make_random()
+        return grid
+    life_map = measure('make_random', make_random)
+    
+    def cycle_all():
+        grid = life_map
+        for i in range(iterations):
+            grid = cycle(grid=grid, survive_min=survive_min, survive_max=survive_max,
+                         resurrect_min=resurrect_min, resurrect_max=resurrect_max)
+        return grid
+    life_map = measure('cycle', cycle_all)
+    
+    life_map, caverns = measure('cleanup', lambda: cleanup(grid=life_map, min_cavern_size=MIN_CAVERN_SIZE))
+    starting_seeds = measure('get_starting_seeds',
+                             lambda: get_starting_seeds(caverns=caverns, min_cavern_size=MIN_CAVERN_SIZE,
+                                                        zone_seed_min_distance=ZONE_SEED_MIN_DISTANCE))
+    measure('make_zones', lambda: make_zones(grid=life_map, starting_seeds=starting_seeds))
+    measure('connect_caverns', lambda: connect_caverns_mst(grid=life_map))
+
+
+def time_stages(map_width, map_height, preset, seed, repeat):
+    """
+    :return: dict of stage name to best wall clock seconds over repeat runs
+    """
+    timings = {}
+    
+    def measure(stage, function):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        timings[stage] = min(elapsed, timings.get(stage, elapsed))
+        return result
+    
+    for i in range(repeat):
+        run_pipeline(map_width=map_width, map_height=map_height, preset=preset, seed=seed, measure=measure)
+    return timings
+
+
+def profile_stages(map_width, map_height, preset, seed):
+    """
+    Separate run from the timed ones, since tracemalloc slows everything down
+    :return: dict of stage name to peak bytes allocated during that stage
+    """
+    peaks = {}
+    
+    def measure(stage, function):
+        tracemalloc.start()
+        try:
+            result = function()
+            peaks[stage] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return result
+    
+    run_pipeline(map_width=map_width, map_height=map_height, preset=preset, seed=seed, measure=measure)
+    return peaks
+
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes, presets, seed, repeat, memory=True):
+    """
+    :param sizes: list of tuple int width height
+    :param presets: list of PRESETS names
+    :param seed: int random seed
+    :param repeat: int number of timed runs per size and preset (the fastest is kept)
+    :param memory: boolean, also record peak memory per stage
+    :return: dict ready to be written as JSON
+    """
+    results = []
+    for (map_width, map_height) in sizes:
+        for name in presets:
+            timings = time_stages(map_width=map_width, map_height=map_height, preset=PRESETS[name], seed=seed,
+                                  repeat=repeat)
+            peaks = {}
+            if memory:
+                peaks = profile_stages(map_width=map_width, map_height=map_height, preset=PRESETS[name], seed=seed)
+            for stage, seconds in timings.items():
+                results.append({'size': '{}x{}'.format(map_width, map_height), 'preset': name, 'stage': stage,
+                                'seconds': seconds, 'peak_bytes': peaks.get(stage)})
+                print('{:>9} {:<9} {:<19} {:>9.4f}s {:>12}'.format(results[-1]['size'], name, stage, seconds,
+                                                                  peaks.get(stage, '')))
+    
+    return {
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'seed': seed,
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def compare(current, previous):
+    """
+    Print the change in time for every stage measured in both runs
+    :param current: benchmark results dict
+    :param previous: benchmark results dict loaded from an earlier JSON file
+    :return: None
+    """
+    before = {(row['size'], row['preset'], row['stage']): row for row in previous['results']}
+    print('compared with commit {}:'.format(previous.get('commit')))
+    for row in current['results']:
+        old = before.get((row['size'], row['preset'], row['stage']))
+        if old and old['seconds'] > 0:
+            print('{:>9} {:<9} {:<19} {:>7.2f}x'.format(row['size'], row['preset'], row['stage'],
+                                                       row['seconds'] / old['seconds']))
+
+
+def parse_size(text):
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark each stage of cavern generation')
+    parser.add_argument('--sizes', nargs='+', type=parse_size, default=SIZES, help='map sizes, e.g. 80x43 256x256')
+    parser.add_argument('--presets', nargs='+', choices=sorted(PRESETS), default=list(PRESETS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc run')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='JSON file from an earlier run to compare against')
+    args = parser.parse_args()
+    
+    results = run_benchmarks(sizes=args.sizes, presets=args.presets, seed=args.seed, repeat=args.repeat,
+                             memory=not args.no_memory)
+    
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+    
+    if args.compare:
+        with open(args.compare) as previous_file:
+            compare(results, json.load(previous_file))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Throughput benchmark of the game's turn logic: plays whole games headless (no window) across a process pool
+
+    python -m src.benchmarks.simulation_benchmark --games 32 --source scripted
+    python -m src.benchmarks.simulation_benchmark --games 4 --record games.json
+    python -m src.benchmarks.simulation_benchmark --replay games.json
+"""
+import argparse
+import json
+import platform
+import statistics
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
+from src.benchmarks.cavern_benchmark import get_commit
+from src.simulation import ACTION_SOURCES, run_game
+
+
+def run_replay(recorded, max_turns):
+    return run_game(seed=recorded['seed'], max_turns=max_turns, replay=recorded['recording'])
+
+
+def run_games(seeds, source, max_turns, workers, record=False, replays=None):
+    """
+    :param seeds: list of int game seeds, one game per seed
+    :param source: str name of an ACTION_SOURCES entry
+    :param max_turns: int number of turns before a game is called a timeout
+    :param workers: int number of worker processes
+    :param record: boolean, keep each game's actions so it can be replayed
+    :param replays: list of recorded game results to play back instead of seeds, or None
+    :return: list of run_game result dicts, and the wall clock seconds they took
+    """
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        if replays is not None:
+            games = list(executor.map(partial(run_replay, max_turns=max_turns), replays))
+        else:
+            games = list(executor.map(partial(run_game, source=source, max_turns=max_turns, record=record), seeds))
+    return games, time.perf_counter() - start
+
+
+def summarize(games, wall_seconds, workers):
+    """
+    :return: dict of throughput, game length and outcome statistics
+    """
+    turns = [game['turns'] for game in games]
+    game_seconds = sum(game['seconds'] for game in games)
+    return {
+        'games': len(games),
+        'workers': workers,
+        'wall_seconds': wall_seconds,
+        'turns': sum(turns),
+        # per process, and for the whole pool
+        'turns_per_second': sum(turns) / game_seconds if game_seconds else None,
+        'pool_turns_per_second': sum(turns) / wall_seconds if wall_seconds else None,
+        'turns_mean': statistics.mean(turns),
+        'turns_median': statistics.median(turns),
+        'turns_min': min(turns),
+        'turns_max': max(turns),
+        'outcomes': dict(Counter(game['outcome'] for game in games)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play headless games to measure turns per second')
+    parser.add_argument('--games', type=int, default=16)
+    parser.add_argument('--source', choices=sorted(ACTION_SOURCES), default='scripted', help='who plays the party')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first game (the rest count up from it)')
+    parser.add_argument('--max-turns', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (defaults to one per CPU)')
+    parser.add_argument('--record', help="write every game's actions to this JSON file, for --replay")
+    parser.add_argument('--replay', help='JSON file from --record to play back')
+    parser.add_argument('--output', help='write results to this JSON file')
+    args = parser.parse_args()
+    
+    replays = None
+    if args.replay:
+        with open(args.replay) as replay_file:
+            replays = json.load(replay_file)['games']
+    
+    seeds = list(range(args.seed, args.seed + args.games))
+    games, wall_seconds = run_games(seeds=seeds, source=args.source, max_turns=args.max_turns,
+                                    workers=args.workers, record=bool(args.record), replays=replays)
+    
+    if args.replay:
+        for game, recorded in zip(games, replays):
+            if (game['outcome'], game['turns']) != (recorded['outcome'], recorded['turns']):
+                print('seed {} replayed differently: {} after {} turns, recorded {} after {} turns'.format(
+                    game['seed'], game['outcome'], game['turns'], recorded['outcome'], recorded['turns']))
+    
+    summary = summarize(games=games, wall_seconds=wall_seconds, workers=args.workers)
+    print('{} games in {:.2f}s: {:.0f} turns/s per process, {:.0f} turns/s for the pool'.format(
+        summary['games'], wall_seconds, summary['turns_per_second'] or 0, summary['pool_turns_per_second'] or 0))
+    print('game length: mean {:.1f}, median {}, min {}, max {} turns'.format(
+        summary['turns_mean'], summary['turns_median'], summary['turns_min'], summary['turns_max']))
+    print('outcomes: {}'.format(', '.join('{} {}'.format(outcome, count)
+                                          for outcome, count in sorted(summary['outcomes'].items()))))
+    
+    if args.record:
+        with open(args.record, 'w') as record_file:
+            json.dump({'games': games}, record_file)
+    
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({
+                'commit': get_commit(),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'source': 'replay' if args.replay else args.source,
+                'max_turns': args.max_turns,
+                'summary': summary,
+                'games': [{key: value for key, value in game.items() if key != 'recording'} for game in games],
+            }, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
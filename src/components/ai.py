@@ -1,17 +1,105 @@
-import tcod as libtcod
+import numpy as np
 
 
 class BasicMonster:
-    def take_turn(self, target, fov_map, game_map, entities):
-        results = []
-        
+    def __init__(self, chase=False, sight_radius=8):
+        """
+        :param chase: boolean, follow the game map's shared chase map instead of running A* every turn
+        :param sight_radius: int distance the monster can see the target from
+        """
+        self.chase = chase
+        self.sight_radius = sight_radius
+    
+    def get_intent(self, target, can_see, game_map, entities, step=None):
+        """
+        Decide what the monster will do, without changing anything on the map
+        :param target: Entity object being hunted
+        :param can_see: boolean True if the monster can see the target
+        :param game_map: GameMap object
+        :param entities: EntityList of Entity objects
+        :param step: tuple int x y chase step already worked out for this monster (see take_turns), or None
+        :return: dict {'move': tuple int x y} or {'attack': PartyMember object}, or None to do nothing
+        """
         monster = self.owner
-        if libtcod.map_is_in_fov(fov_map, monster.x, monster.y):
+        if can_see:
             
             if monster.distance_to(target) >= 2:
-                monster.move_astar(target=target, entities=entities, game_map=game_map)
+                if step is None:
+                    if self.chase:
+                        step = monster.get_chase_step(target=target, entities=entities, game_map=game_map)
+                    else:
+                        step = monster.get_astar_step(target=target, entities=entities, game_map=game_map)
+                if step:
+                    return {'move': step}
             
-            elif target.party.members and monster.party.random_member_no_cooldown():
-                attack_results = monster.party.random_member_no_cooldown().attack(target=target)
-                results.extend(attack_results)
-        return results
+            elif target.party.members:
+                member = monster.party.random_member_no_cooldown()
+                if member:
+                    return {'attack': member}
+        return None
+
+
+def take_turns(monsters, target, perception, game_map, entities):
+    """
+    Enemy turn for every monster acting at the same moment, in two phases:
+     - every monster decides what to do against the map as it stands (chase steps for the whole batch are looked up
+       at once), so no monster's decision depends on another having moved first
+     - the intents are then carried out in a fixed order (see resolve_intents)
+    :param monsters: list of Entity objects with ai
+    :param target: Entity object being hunted
+    :param perception: Perception object updated for the target
+    :param game_map: GameMap object
+    :param entities: EntityList of Entity objects
+    :return: list of result dicts
+    """
+    # closest first, then by location - never by the order the monsters were handed in
+    monsters = sorted(monsters, key=lambda monster: (monster.distance_to(target), monster.y, monster.x))
+    if not monsters:
+        return []
+    xs = np.array([monster.x for monster in monsters])
+    ys = np.array([monster.y for monster in monsters])
+    radii = np.array([monster.ai.sight_radius for monster in monsters])
+    can_see = perception.get_observers(xs, ys, radii)
+    
+    steps = {}
+    chasing = np.array([monster.ai.chase for monster in monsters]) & can_see & \
+        (np.abs(xs - target.x) + np.abs(ys - target.y) >= 2)
+    if chasing.any():
+        game_map.chase_map.update(target.x, target.y)
+        step_xs, step_ys, found = game_map.chase_map.get_steps(xs[chasing], ys[chasing],
+                                                               game_map.navigation.occupancy)
+        for index, step_x, step_y in zip(np.nonzero(chasing)[0][found].tolist(), step_xs[found].tolist(),
+                                         step_ys[found].tolist()):
+            steps[index] = (step_x, step_y)
+    
+    intents = [(monster, monster.ai.get_intent(target=target, can_see=bool(can_see[index]), game_map=game_map,
+                                               entities=entities, step=steps.get(index)))
+               for index, monster in enumerate(monsters)]
+    return resolve_intents(intents=intents, target=target, game_map=game_map)
+
+
+def resolve_intents(intents, target, game_map):
+    """
+    Carry out the monsters' intents in the order given
+     - a tile two monsters want to move to goes to the first of them, the other stays put
+     - attacks stop once the target's party is gone
+    :param intents: list of (Entity object, intent dict or None) in the order to act
+    :param target: Entity object being hunted
+    :param game_map: GameMap object
+    :return: list of result dicts
+    """
+    results = []
+    for monster, intent in intents:
+        if not intent or not monster.ai:
+            continue
+        move = intent.get('move')
+        member = intent.get('attack')
+        
+        if move:
+            (x, y) = move
+            if not game_map.is_blocked(x, y) and not game_map.navigation.occupancy[x, y]:
+                monster.place(x, y)
+        
+        elif member and target.party.members:
+            results.extend(member.attack(target=target))
+    return results
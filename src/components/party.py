@@ -2,6 +2,7 @@ from random import choice
 
 import tcod as libtcod
 
+from src.game_clock import game_clock
 from src.game_messages import Message
 
 
@@ -13,6 +14,8 @@ class Party:
         """
         self.members = []
         self.coins = coins
+        # turns ticked off every member's cooldown on top of the game clock (see tick_all)
+        self.tick_offset = 0
     
     def add_member(self, party_member):
         """
@@ -21,6 +24,10 @@ class Party:
         :return: results and message
         """
         if len(self.members) < 6:
+            # keep the member's remaining cooldown the same under this party's tick offset
+            cooldown = party_member.cooldown
+            party_member.party = self
+            party_member.cooldown = cooldown
             self.members.append(party_member)
             message = Message('{} {} added to party'.format(party_member.profession, party_member.name),
                               color=libtcod.lighter_blue)
@@ -82,12 +89,12 @@ class Party:
     
     def tick_all(self, amount=1):
         """
-        Iterate through all party members in list, ticking a turn off of their cooldown counter
+        Tick turns off of every party member's cooldown at once, by moving the party's clock forward
+        (the game clock ticks everyone, every turn - this is for extra ticks, like healing)
         :param amount: int amount of turns to remove from cooldown for each PartyMember object
         :return: None
         """
-        for member in self.members:
-            member.tick(amount=amount)
+        self.tick_offset += amount
     
     def add_coins(self, amount):
         """
@@ -130,7 +137,7 @@ class Party:
 
 
 class PartyMember:
-    def __init__(self, name, profession, offensive_cd, defensive_cd, attack_type, cost, cooldown=0):
+    def __init__(self, name, profession, offensive_cd, defensive_cd, attack_type, cost, cooldown=0, clock=None):
         """
         Class to hold information for individual party members
         :param name: str name of party member
@@ -140,6 +147,7 @@ class PartyMember:
         :param attack_type: dependant on profession
         :param cost: int amount of gold paid out per turn time
         :param cooldown: int current cooldown
+        :param clock: GameClock object the cooldown counts down against (defaults to the global game_clock)
         """
         self.name = name
         self.profession = profession
@@ -147,18 +155,39 @@ class PartyMember:
         self.defensive_cd = defensive_cd
         self.attack_type = attack_type
         self.cost = cost
+        self.clock = clock or game_clock
+        # the Party this member is in, set by Party.add_member
+        self.party = None
+        # turn (on the clock, plus the party's tick offset) the member is off cooldown
+        self.ready_at = 0
         self.cooldown = cooldown
     
+    def get_time(self):
+        """
+        :return: int current turn for this member: the clock plus any extra ticks given to its party
+        """
+        if self.party:
+            return self.clock.turn + self.party.tick_offset
+        return self.clock.turn
+    
+    @property
+    def cooldown(self):
+        """
+        Turns left until the member is ready, worked out from ready_at (never negative)
+        """
+        return max(0, self.ready_at - self.get_time())
+    
+    @cooldown.setter
+    def cooldown(self, cooldown):
+        self.ready_at = self.get_time() + cooldown
+    
     def tick(self, amount=1):
         """
         Reduce cooldown for party member by amount number of turns (and don't go negative!)
         :param amount: int number of turns to reduce cooldown by
         :return: None
         """
-        if self.cooldown > 0:
-            self.cooldown -= amount
-            if self.cooldown < 0:
-                self.cooldown = 0
+        self.cooldown = max(0, self.cooldown - amount)
     
     def get_cost(self):
         """
@@ -1,16 +1,15 @@
+from random import getrandbits
+
 import tcod as libtcod
 
-from src.attack_types import get_target_tiles
-from src.components.party import Party, PartyMember
-from src.death_functions import kill_monster, kill_player
-from src.entity import Entity, get_blocking_entities_at_location
-from src.fov_functions import initialize_fov, recompute_fov
-from src.game_messages import MessageLog, Message
-from src.game_states import GameStates
+from src.entity import EntityList
+from src.game_messages import MessageLog
 from src.input_handlers import handle_keys, handle_mouse
-from src.map_objects.caverns import distance_to
+from src.map_objects.chunks import ChunkGenerator
 from src.map_objects.game_map import GameMap
-from src.render_functions import render_all, clear_all, RenderOrder
+from src.map_objects.level_pregenerator import LevelPregenerator
+from src.render_functions import render_all, clear_all
+from src.simulation import Simulation, create_player
 
 
 def main():
@@ -45,7 +44,25 @@ def main():
     min_cavern_size = 15
     max_monsters_per_room = 3
     
+    # levels are cached on disk by seed, set level_seed to a fixed int to replay a known level
+    level_seed = getrandbits(32)
+    level_cache_directory = 'level_cache'
+    levels_ahead = 2
+    
+    # set chunk_size (e.g. 32) to generate the map chunk by chunk as the player explores it, instead of all at once
+    chunk_size = 0
+    
+    # set chase_monsters to have monsters step down one shared distance field from the player, instead of each running
+    # A* every turn (cheaper when many monsters chase at once)
+    chase_monsters = False
+    
     fov_radius = 8
+    # longest distance any monster can see the player from
+    monster_sight_radius = 8
+    # monsters only take turns while awake: they wake near the player or on hearing a fight, and sleep when far away
+    wake_radius = monster_sight_radius
+    sleep_radius = 2 * monster_sight_radius
+    noise_radius = 10
     
     colors = {
         'dark_wall': libtcod.darker_gray,
@@ -54,23 +71,18 @@ def main():
         'light_ground': libtcod.light_sepia
     }
     
-    party_component = Party()
-    member_1 = PartyMember(name="Bill", profession="Soldier", offensive_cd=4, defensive_cd=4,
-                           attack_type={'line': 1}, cost=5)
-    member_2 = PartyMember(name="John", profession="Archer", offensive_cd=5, defensive_cd=5,
-                           attack_type={'direct': 4}, cost=4)
-    member_3 = PartyMember(name="Sam", profession="Defender", offensive_cd=5, defensive_cd=3,
-                           attack_type={'line': 1}, cost=5)
-    member_4 = PartyMember(name="Ivan", profession="Ice Mage", offensive_cd=6, defensive_cd=6,
-                           attack_type={'cone': 3}, cost=8)
-    party_component.add_member(member_1)
-    party_component.add_member(member_2)
-    party_component.add_member(member_3)
-    party_component.add_member(member_4)
-    player = Entity(x=0, y=0, char='@', color=libtcod.white, name='Hero Party', blocks=True,
-                    render_order=RenderOrder.ACTOR,
-                    party=party_component)
-    entities = [player]
+    player = create_player()
+    entities = EntityList([player])
+    
+    # start generating levels in the background while the window is set up
+    level_params = dict(map_width=map_width, map_height=map_height, survive_min=survive_min,
+                        survive_max=survive_max, resurrect_min=resurrect_min, resurrect_max=resurrect_max,
+                        iterations=iterations, zone_seed_min_distance=zone_seed_min_distance,
+                        min_cavern_size=min_cavern_size)
+    level_pregenerator = None
+    if not chunk_size:
+        level_pregenerator = LevelPregenerator(level_params=level_params, levels_ahead=levels_ahead,
+                                               first_seed=level_seed, cache_directory=level_cache_directory)
     
     libtcod.console_set_custom_font(fontFile='images/arial10x10.png',
                                     flags=libtcod.FONT_TYPE_GREYSCALE | libtcod.FONT_LAYOUT_TCOD)
@@ -80,34 +92,39 @@ def main():
     con = libtcod.console_new(w=screen_width, h=screen_height)
     panel = libtcod.console_new(w=screen_width, h=panel_height)
     
-    game_map = GameMap(width=map_width, height=map_height)
-    game_map.make_map(survive_min=survive_min, survive_max=survive_max, resurrect_min=resurrect_min,
-                      resurrect_max=resurrect_max, iterations=iterations,
-                      zone_seed_min_distance=zone_seed_min_distance,
-                      min_cavern_size=min_cavern_size, player=player, entities=entities,
-                      max_monsters_per_room=max_monsters_per_room)
-    
-    fov_recompute = True
-    fov_map = initialize_fov(game_map=game_map)
+    game_map = GameMap(width=map_width, height=map_height, chase_monsters=chase_monsters)
+    if chunk_size:
+        chunk_generator = ChunkGenerator(seed=level_seed, chunk_size=chunk_size, survive_min=survive_min,
+                                         survive_max=survive_max, resurrect_min=resurrect_min,
+                                         resurrect_max=resurrect_max, iterations=iterations,
+                                         zone_seed_min_distance=zone_seed_min_distance,
+                                         min_cavern_size=min_cavern_size)
+        game_map.make_chunked_map(chunk_generator=chunk_generator, player=player, entities=entities,
+                                  max_monsters_per_room=max_monsters_per_room, load_radius=fov_radius + chunk_size)
+    else:
+        life_map, zones, zone_graph = level_pregenerator.get_level()
+        game_map.load_level(life_map=life_map, zones=zones, zone_graph=zone_graph, player=player, entities=entities,
+                            max_monsters_per_room=max_monsters_per_room)
     
     message_log = MessageLog(x=message_x, width=message_width, height=message_height)
     
+    simulation = Simulation(player=player, entities=entities, game_map=game_map, message_log=message_log,
+                            fov_radius=fov_radius, monster_sight_radius=monster_sight_radius,
+                            wake_radius=wake_radius, sleep_radius=sleep_radius, noise_radius=noise_radius,
+                            max_monsters_per_room=max_monsters_per_room)
+    
     key = libtcod.Key()
     mouse = libtcod.Mouse()
     
-    game_state = GameStates.PLAYER_TURN
-    previous_member = None
-    target_tiles = None
-    
     while not libtcod.console_is_window_closed():
         libtcod.sys_check_for_event(mask=libtcod.EVENT_KEY_PRESS | libtcod.EVENT_MOUSE, k=key, m=mouse)
         
-        if fov_recompute:
-            recompute_fov(fov_map=fov_map, x=player.x, y=player.y, radius=fov_radius)
+        simulation.compute_fov()
         
-        render_all(con=con, panel=panel, entities=entities, player=player, game_map=game_map, fov_map=fov_map,
-                   fov_recompute=fov_recompute, message_log=message_log, screen_width=screen_width,
-                   screen_height=screen_height, acting_member=previous_member, target_tiles=target_tiles,
+        render_all(con=con, panel=panel, entities=entities, player=player, game_map=game_map,
+                   fov_cache=simulation.fov_cache, fov_recompute=simulation.fov_recompute, message_log=message_log,
+                   screen_width=screen_width, screen_height=screen_height,
+                   acting_member=simulation.previous_member, target_tiles=simulation.target_tiles,
                    bar_width=bar_width, panel_height=panel_height, panel_y=panel_y, mouse=mouse, colors=colors)
         
         libtcod.console_flush()
@@ -115,165 +132,22 @@ def main():
         clear_all(con=con, entities=entities)
         
         # --------- PLAYER TURN: GET INPUTS -------------
-        action = handle_keys(key=key, game_state=game_state)
-        mouse_action = handle_mouse(mouse)
-        
-        move = action.get('move')
-        exit_game = action.get('exit_game')
-        fullscreen = action.get('fullscreen')
-        auto = action.get('auto')
-        selected_member = action.get('member')
-        act_dir = action.get('act_dir')
+        action = handle_keys(key=key, game_state=simulation.game_state)
+        handle_mouse(mouse)
         
-        left_click = mouse_action.get('left_click')
-        right_click = mouse_action.get('right_click')
-        
-        # --------- PLAYER TURN: PROCESS INPUTS -------------
-        player_turn_results = []
-        
-        # AUTOMATIC -----------------------------------------
-        if auto and GameStates.PLAYER_TURN:
-            for entity in entities:
-                if not entity.ai and not entity.blocks and entity.party.members \
-                        and entity.x == player.x and entity.y == player.y:
-                    player_turn_results.append({'add_member': entity})
-                elif not entity.ai and not entity.blocks and entity.party.coins \
-                        and entity.x == player.x and entity.y == player.y:
-                    player_turn_results.append({'loot_coins': entity})
-            else:  # Wait
-                game_state = GameStates.ENEMY_TURN
-        
-        # MOVEMENT ------------------------------------------
-        if move and game_state == GameStates.PLAYER_TURN:
-            dx, dy = move
-            destination_x = player.x + dx
-            destination_y = player.y + dy
-            
-            if not game_map.is_blocked(x=destination_x, y=destination_y) \
-                    and not get_blocking_entities_at_location(entities=entities, x=destination_x, y=destination_y):
-                player.move(dx=dx, dy=dy)
-                fov_recompute = True
-                game_state = GameStates.ENEMY_TURN
-        
-        # SELECTED MEMBER -----------------------------------
-        if selected_member and selected_member <= len(player.party.members) and \
-                player.party.members[selected_member - 1].cooldown < 1:
-            if not previous_member:
-                previous_member = selected_member
-                target_tiles = get_target_tiles(entity=player, member=previous_member - 1, game_map=game_map,
-                                                fov_map=fov_map)
-                player_turn_results.append({'message': Message("Direction?")})
-                game_state = GameStates.TARGETING
-            
-            elif previous_member == selected_member:
-                previous_member = None
-                target_tiles = None
-                game_state = GameStates.PLAYER_TURN
-        
-        if act_dir and previous_member and game_state == GameStates.TARGETING:
-            attack_tiles = get_target_tiles(entity=player, member=previous_member - 1, game_map=game_map,
-                                            fov_map=fov_map, attack_dir=[act_dir])
-            targets = [entity for entity in entities if (entity.x, entity.y) in attack_tiles and entity.ai]
-            
-            # TODO this code should really be somewhere else...
-            if targets:
-                if player.party.members[previous_member - 1].attack_type.get('line'):
-                    for target in targets:
-                        attack_results = player.party.members[previous_member - 1].attack(target=target)
-                        player_turn_results.extend(attack_results)
-                elif player.party.members[previous_member - 1].attack_type.get('direct'):
-                    closest = targets[0]
-                    closest_dist = distance_to(player.x, closest.x, player.y, closest.y)
-                    targets.remove(closest)
-                    for target in targets:
-                        distance = distance_to(player.x, player.y, target.x, target.y)
-                        if distance < closest_dist:
-                            closest = target
-                            closest_dist = distance
-                    attack_results = player.party.members[previous_member - 1].attack(target=closest)
-                    player_turn_results.extend(attack_results)
-                elif player.party.members[previous_member - 1].attack_type.get('cone'):
-                    for target in targets:
-                        attack_results = player.party.members[previous_member - 1].attack(target=target)
-                        player_turn_results.extend(attack_results)
-            
-            else:
-                player_turn_results.append({'message': Message("Attack hits nothing")})
-            previous_member = None
-            target_tiles = None
-            game_state = GameStates.ENEMY_TURN
-        
-        if exit_game:
+        if action.get('exit_game'):
+            if level_pregenerator:
+                level_pregenerator.shutdown()
             return True
         
-        if fullscreen:
+        if action.get('fullscreen'):
             libtcod.console_set_fullscreen(fullscreen=not libtcod.console_is_fullscreen())
         
-        # --------- PLAYER TURN: PROCESS RESULTS -------------
-        for result in player_turn_results:
-            rescued_members = result.get('add_member')
-            message = result.get('message')
-            dead_entity = result.get('dead')
-            loot_coins = result.get('loot_coins')
-            
-            if rescued_members:
-                for member in rescued_members.party.members:
-                    msg, res = player.party.add_member(member)
-                    message_log.add_message(msg)
-                    if res:
-                        entities.remove(rescued_members)
-            
-            if loot_coins:
-                msg = player.party.add_coins(loot_coins.party.coins)
-                message_log.add_message(msg)
-                entities.remove(loot_coins)
-            
-            if message:
-                message_log.add_message(message=message)
-            
-            if dead_entity:
-                if dead_entity == player:
-                    msg, game_state = kill_player(dead_entity)
-                else:
-                    msg = kill_monster(dead_entity)
-                
-                message_log.add_message(message=msg)
-        
-        # --------- ENEMY TURN: GET INPUT -------------
-        if game_state == GameStates.ENEMY_TURN:
-            entities_in_distance_order = sorted(entities, key=lambda z: z.distance_to(player))
-            
-            for entity in entities_in_distance_order:
-                if entity.ai:
-                    enemy_turn_results = entity.ai.take_turn(target=player, fov_map=fov_map, game_map=game_map,
-                                                             entities=entities)
-                    # --------- ENEMY TURN: PROCESS RESULTS -------------
-                    for result in enemy_turn_results:
-                        message = result.get('message')
-                        dead_entity = result.get('dead')
-                        
-                        if message:
-                            message_log.add_message(message=message)
-                        
-                        if dead_entity:
-                            if dead_entity == player:
-                                message, game_state = kill_player(player=dead_entity)
-                            else:
-                                message = kill_monster(entity=dead_entity)
-                            
-                            message_log.add_message(message=message)
-                            
-                            if game_state == GameStates.PLAYER_DEAD:
-                                break
-                    
-                    if game_state == GameStates.PLAYER_DEAD:
-                        break
-            
-            else:
-                game_state = GameStates.PLAYER_TURN
-                for entity in entities:
-                    if entity.party:
-                        entity.party.tick_all()
+        # --------- PLAYER TURN, THEN ENEMY TURN -------------
+        simulation.take_action(action)
+    
+    if level_pregenerator:
+        level_pregenerator.shutdown()
 
 
 if __name__ == '__main__':
@@ -1,11 +1,12 @@
-import tcod as libtcod
-
 from src.render_functions import RenderOrder
 
+# longest path a monster follows straight to its target - further away, it plans over the zone graph instead
+MAX_PATH_LENGTH = 25
+
 
 class Entity:
     def __init__(self, x, y, char, color, name, blocks=False, render_order=RenderOrder.CORPSE, party=None,
-                 ai=None):
+                 ai=None, speed=100):
         """
         A generic object to represent players, enemies, items, etc.
         :param x: horizontal position on map
@@ -17,17 +18,23 @@ class Entity:
         :param render_order: enum render order for entities
         :param party: party component
         :param ai: artificial intelligence (AI) component
+        :param speed: int actions per 100 turns of game time (see TurnScheduler)
 
         """
+        # the EntityList this entity is in, kept up to date by its append and remove
+        self.entity_list = None
         self.x = x
         self.y = y
         self.char = char
         self.color = color
         self.name = name
-        self.blocks = blocks
+        self._blocks = blocks
         self.render_order = render_order
         self.party = party
         self.ai = ai
+        self.speed = speed
+        # CachedPath kept between turns by get_astar_step (to the target, or to the next waypoint of a long route)
+        self.path = None
         
         if self.party:
             self.party.owner = self
@@ -35,6 +42,20 @@ class Entity:
         if self.ai:
             self.ai.owner = self
     
+    @property
+    def blocks(self):
+        return self._blocks
+    
+    @blocks.setter
+    def blocks(self, blocks):
+        """
+        Entities stop blocking when they die, which their EntityList needs to know about
+        """
+        changed = blocks != self._blocks
+        self._blocks = blocks
+        if changed and self.entity_list is not None:
+            self.entity_list.update_blocking(self)
+    
     def move(self, dx, dy):
         """
         Change x and y coordinates of Entity object
@@ -42,80 +63,238 @@ class Entity:
         :param dy: int direction on y axis
         :return: None
         """
-        self.x += dx
-        self.y += dy
+        self.place(self.x + dx, self.y + dy)
     
-    def move_towards(self, target_x, target_y, game_map, entities):
+    def place(self, x, y):
+        """
+        Put the Entity object at a location, keeping its EntityList's position index (and navigation grid) up to date
+        :param x: int horizontal position on map
+        :param y: int vertical position on map
+        :return: None
+        """
+        (old_x, old_y) = (self.x, self.y)
+        self.x = x
+        self.y = y
+        if self.entity_list is not None:
+            self.entity_list.update_position(self, old_x, old_y)
+    
+    def get_step_towards(self, target_x, target_y, game_map, entities):
+        """
+        Naive step towards a location, the backup when there is no path
+        :return: tuple int x y of the tile to step to, or None to stay put
+        """
         dx = abs(target_x - self.x)
         dy = abs(target_y - self.y)
         
         if 0 < self.x + dx < game_map.width and 0 < self.y + dy < game_map.height and \
                 not (game_map.is_blocked(x=self.x + dx, y=self.y + dy) or
                      get_blocking_entities_at_location(entities=entities, x=self.x + dx, y=self.y + dy)):
-            self.move(dx, dy)
+            return self.x + dx, self.y + dy
+        return None
     
     def distance_to(self, other):
         dx = abs(other.x - self.x)
         dy = abs(other.y - self.y)
         return dx + dy
     
-    def move_astar(self, target, entities, game_map):
-        # Create a FOV map that has the dimensions of the map
-        fov = libtcod.map_new(game_map.width, game_map.height)
-        
-        # Scan the current map each turn and set all the walls as unwalkable
-        for y1 in range(game_map.height):
-            for x1 in range(game_map.width):
-                libtcod.map_set_properties(fov, x1, y1, not game_map.tiles[x1][y1].block_sight,
-                                           not game_map.tiles[x1][y1].blocked)
-        
-        # Scan all the objects to see if there are objects that must be navigated around
-        # Check also that the object isn't self or the target (so that the start and the end points are free)
-        # The AI class handles the situation if self is next to the target so it will not use this A* function anyway
-        for entity in entities:
-            if entity.blocks and entity != self and entity != target:
-                # Set the tile as a wall so it must be navigated around
-                libtcod.map_set_properties(fov, entity.x, entity.y, True, False)
-        
-        # Allocate a A* path
-        # The 1.41 is the normal diagonal cost of moving, it can be set as 0.0 if diagonal moves are prohibited
-        my_path = libtcod.path_new_using_map(fov, 0.0)
-        
-        # Compute the path between self's coordinates and the target's coordinates
-        libtcod.path_compute(my_path, self.x, self.y, target.x, target.y)
-        
-        # Check if the path exists, and in this case, also the path is shorter than 25 tiles
-        # The path size matters if you want the monster to use alternative longer paths
-        #   (for example through other rooms) if for example the player is in a corridor
-        # It makes sense to keep path size relatively low to keep the monsters from running around
-        #   the map if there's an alternative path really far away
-        if not libtcod.path_is_empty(my_path) and libtcod.path_size(my_path) < 25:
-            # Find the next coordinates in the computed full path
-            x, y = libtcod.path_walk(my_path, True)
-            if x or y:
-                # Set self's coordinates to the next path tile
-                self.x = x
-                self.y = y
+    def get_astar_step(self, target, entities, game_map):
+        """
+        Next step towards the target along an A* path, for a monster's move intent (see BasicMonster.get_intent)
+        Only works the step out - resolve_intents takes it, and the cached path moves on by itself once the monster
+        is on its first step
+        :param target: Entity object to move towards
+        :param entities: EntityList of Entity objects
+        :param game_map: GameMap object
+        :return: tuple int x y, or None to stay put
+        """
+        if game_map.zone_graph and self.distance_to(target) >= MAX_PATH_LENGTH:
+            # Too far for a short path: plan the route over the zone graph first, and only search the map as far as
+            # its next waypoint, instead of an A* over everything between here and the target
+            step = self.get_route_step(target=target, game_map=game_map)
         else:
+            # Search the map shared by all monsters (see NavigationGrid) - walls and blocking entities are already
+            # marked as unwalkable, and the search opens up self's and the target's tiles so the start and end points
+            # are free
+            # The AI class handles the situation if self is next to the target so it will not use this A* function
+            # The path from earlier turns is reused unless the target has moved away, the way is blocked or the map
+            # changed
+            self.path = game_map.navigation.get_path(self.path, self.x, self.y, target.x, target.y)
+            path = self.path.steps
+            
+            # Check if the path exists, and in this case, also the path is shorter than MAX_PATH_LENGTH tiles
+            # The path size matters if you want the monster to use alternative longer paths
+            #   (for example through other rooms) if for example the player is in a corridor
+            # It makes sense to keep path size relatively low to keep the monsters from running around
+            #   the map if there's an alternative path really far away
+            if path and len(path) < MAX_PATH_LENGTH:
+                # Find the next coordinates in the computed full path
+                return path[0]
+            step = None
+            if path:
+                # a long way round to a target that is close by: follow the zone graph's route instead
+                step = self.get_route_step(target=target, game_map=game_map)
+        
+        if step is None:
             # Keep the old move function as a backup so that if there are no paths
             #  (for example another monster blocks a corridor)
             # it will still try to move towards the player (closer to the corridor opening)
-            self.move_towards(target.x, target.y, game_map, entities)
+            step = self.get_step_towards(target.x, target.y, game_map, entities)
+        return step
+    
+    def get_route_step(self, target, game_map):
+        """
+        Long range step: plan a route over the map's zone graph, and path only as far as its next waypoint
+        :param target: Entity object to move towards
+        :param game_map: GameMap object
+        :return: tuple int x y to step to, or None if there is no route (or its next step is taken)
+        """
+        if not game_map.zone_graph:
+            return None
+        route = game_map.zone_graph.find_route(self.x, self.y, target.x, target.y)
+        if not route:
+            return None
+        waypoint = route[0]
+        if waypoint == (self.x, self.y):
+            if len(route) < 2:
+                return None
+            waypoint = route[1]
         
-        # Delete the path to free memory
-        libtcod.path_delete(my_path)
+        # the leg to the waypoint is cached like any other path, so it is only searched again when it goes stale
+        self.path = game_map.navigation.get_path(self.path, self.x, self.y, *waypoint)
+        if not self.path.steps:
+            return None
+        (x, y) = self.path.steps[0]
+        if game_map.navigation.occupancy[x, y]:
+            # the waypoint itself is taken
+            return None
+        return x, y
+    
+    def get_chase_step(self, target, entities, game_map):
+        """
+        Step down the shared chase map towards the target (cheaper than A* when many monsters chase the player)
+        :param target: Entity object the chase map is centred on
+        :param entities: EntityList of Entity objects
+        :param game_map: GameMap object
+        :return: tuple int x y to step to, or None to stay put
+        """
+        game_map.chase_map.update(target.x, target.y)
+        step = game_map.chase_map.get_step(self.x, self.y, game_map.navigation.occupancy)
+        if step is None:
+            # out of range, or the way is blocked by other monsters - same backup as get_astar_step
+            step = self.get_step_towards(target.x, target.y, game_map, entities)
+        return step
 
 
 def get_blocking_entities_at_location(entities, x, y):
     """
     Returns blocking entity in a location
-    :param entities: list of Entity objects
+    :param entities: EntityList of Entity objects
     :param x: horizontal location
     :param y: vertical location
     :return: blocking Entity object in destination (x, y) or None if no Entity object in destination block movement
     """
-    for entity in entities:
-        if entity.blocks and entity.x == x and entity.y == y:
+    for entity in entities.get_at(x, y):
+        if entity.blocks:
             return entity
     
     return None
+
+
+class EntityList(list):
+    def __init__(self, entities=(), bucket_size=8):
+        """
+        List of Entity objects that also indexes them by position, so finding what is on (or near) a tile doesn't
+        mean scanning every entity on the level
+        Entities must be added and removed through append / extend / remove, and moved through Entity.move or
+        Entity.place, for the index to stay correct
+        :param entities: iterable of Entity objects to start with
+        :param bucket_size: int width and height of the squares entities are grouped in for get_near
+        """
+        super().__init__()
+        self.positions = {}
+        self.bucket_size = bucket_size
+        self.buckets = {}
+        self.navigation = None
+        self.extend(entities)
+    
+    def set_navigation(self, navigation):
+        """
+        Keep a NavigationGrid's occupancy overlay in step with the blocking entities in the list
+        :param navigation: NavigationGrid object
+        :return: None
+        """
+        self.navigation = navigation
+        navigation.set_blockers(self)
+    
+    def get_bucket(self, x, y):
+        return x // self.bucket_size, y // self.bucket_size
+    
+    def add_position(self, entity):
+        self.positions.setdefault((entity.x, entity.y), []).append(entity)
+        self.buckets.setdefault(self.get_bucket(entity.x, entity.y), []).append(entity)
+        if self.navigation and entity.blocks:
+            self.navigation.add_blocker(entity.x, entity.y)
+    
+    def remove_position(self, entity, x, y):
+        for (index, key) in ((self.positions, (x, y)), (self.buckets, self.get_bucket(x, y))):
+            here = index.get(key)
+            if here and entity in here:
+                here.remove(entity)
+                if not here:
+                    del index[key]
+        if self.navigation and entity.blocks:
+            self.navigation.remove_blocker(x, y)
+    
+    def append(self, entity):
+        super().append(entity)
+        entity.entity_list = self
+        self.add_position(entity)
+    
+    def extend(self, entities):
+        for entity in entities:
+            self.append(entity)
+    
+    def remove(self, entity):
+        super().remove(entity)
+        entity.entity_list = None
+        self.remove_position(entity, entity.x, entity.y)
+    
+    def update_position(self, entity, old_x, old_y):
+        """
+        Called by Entity.place whenever an entity in the list changes location
+        :return: None
+        """
+        self.remove_position(entity, old_x, old_y)
+        self.add_position(entity)
+    
+    def update_blocking(self, entity):
+        """
+        Called when an entity in the list starts or stops blocking movement
+        :return: None
+        """
+        if self.navigation:
+            if entity.blocks:
+                self.navigation.add_blocker(entity.x, entity.y)
+            else:
+                self.navigation.remove_blocker(entity.x, entity.y)
+    
+    def get_at(self, x, y):
+        """
+        :return: list of Entity objects at the location (don't modify it - it belongs to the index)
+        """
+        return self.positions.get((x, y), [])
+    
+    def get_near(self, x, y, radius):
+        """
+        Entities within radius tiles on both axes of a location, looking only in the buckets that overlap that square
+        :return: list of Entity objects
+        """
+        (min_bx, min_by) = self.get_bucket(x - radius, y - radius)
+        (max_bx, max_by) = self.get_bucket(x + radius, y + radius)
+        near = []
+        for bx in range(min_bx, max_bx + 1):
+            for by in range(min_by, max_by + 1):
+                for entity in self.buckets.get((bx, by), ()):
+                    if abs(entity.x - x) <= radius and abs(entity.y - y) <= radius:
+                        near.append(entity)
+        return near
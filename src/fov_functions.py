@@ -1,16 +1,171 @@
+from collections import OrderedDict
+
+import numpy as np
 import tcod as libtcod
 
 
 def initialize_fov(game_map):
+    """
+    Build an fov map from the game map's arrays, and keep it in sync as tiles change
+    :param game_map: GameMap object
+    :return: libtcod map
+    """
     fov_map = libtcod.map_new(game_map.width, game_map.height)
     
-    for y in range(game_map.height):
-        for x in range(game_map.width):
-            libtcod.map_set_properties(m=fov_map, x=x, y=y, isTrans=not game_map.tiles[x][y].block_sight,
-                                       isWalk=not game_map.tiles[x][y].blocked)
+    # the fov map's arrays are indexed [y][x], the game map's [x][y]
+    fov_map.transparent[:] = ~game_map.block_sight.T
+    fov_map.walkable[:] = ~game_map.blocked.T
+    
+    game_map.add_tile_listener(lambda x, y, width, height: update_fov_region(fov_map=fov_map, game_map=game_map,
+                                                                           x=x, y=y, width=width, height=height))
     
     return fov_map
 
 
+def update_fov_region(fov_map, game_map, x, y, width, height):
+    """
+    Copy a rectangle of the game map into the fov map (for example when a chunk is generated), clipped to the map
+    initialize_fov registers this as a tile listener, so it normally doesn't need calling directly
+    :param fov_map: libtcod map
+    :param game_map: GameMap object
+    :param x: left edge of the rectangle
+    :param y: top edge of the rectangle
+    :param width: width of the rectangle
+    :param height: height of the rectangle
+    :return: None
+    """
+    x1, y1 = max(0, x), max(0, y)
+    x2, y2 = min(game_map.width, x + width), min(game_map.height, y + height)
+    if x1 >= x2 or y1 >= y2:
+        return
+    fov_map.transparent[y1:y2, x1:x2] = ~game_map.block_sight[x1:x2, y1:y2].T
+    fov_map.walkable[y1:y2, x1:x2] = ~game_map.blocked[x1:x2, y1:y2].T
+
+
 def recompute_fov(fov_map, x, y, radius, light_walls=True, algorithm=0):  # 1 = diamond algorithm - it's orthogonal
     libtcod.map_compute_fov(m=fov_map, x=x, y=y, radius=radius, light_walls=light_walls, algo=algorithm)
+
+
+class FovCache:
+    def __init__(self, fov_map, game_map, max_entries=64, light_walls=True, algorithm=0):
+        """
+        Least recently used cache of fov results, keyed by (x, y, radius) of the observer
+        Each result is the visible window around the observer, and is dropped as soon as a tile inside that window
+        changes whether it blocks sight (the cache listens to the game map for that)
+        :param fov_map: libtcod map from initialize_fov
+        :param game_map: GameMap object
+        :param max_entries: int number of results to keep
+        :param light_walls: boolean, passed on to recompute_fov
+        :param algorithm: int libtcod fov algorithm, passed on to recompute_fov
+        """
+        self.fov_map = fov_map
+        self.width = game_map.width
+        self.height = game_map.height
+        self.max_entries = max_entries
+        self.light_walls = light_walls
+        self.algorithm = algorithm
+        self.entries = OrderedDict()
+        self.visible = np.zeros((game_map.width, game_map.height), dtype=bool)
+        self.hits = 0
+        self.misses = 0
+        game_map.add_tile_listener(self.invalidate)
+    
+    def get_window(self, x, y, radius):
+        """
+        :return: (int left, int top, 2d boolean array indexed [x][y]) visible tiles around the observer
+        """
+        key = (x, y, radius)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+        
+        self.misses += 1
+        recompute_fov(fov_map=self.fov_map, x=x, y=y, radius=radius, light_walls=self.light_walls,
+                      algorithm=self.algorithm)
+        x1, y1 = max(0, x - radius), max(0, y - radius)
+        x2, y2 = min(self.width, x + radius + 1), min(self.height, y + radius + 1)
+        # the fov map's arrays are indexed [y][x]
+        entry = (x1, y1, self.fov_map.fov[y1:y2, x1:x2].T.copy())
+        self.entries[key] = entry
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return entry
+    
+    def compute(self, x, y, radius):
+        """
+        Replacement for recompute_fov: makes (x, y, radius) the current fov, read through visible / is_visible
+        :return: 2d boolean array indexed [x][y] of visible tiles
+        """
+        x1, y1, window = self.get_window(x, y, radius)
+        self.visible[:] = False
+        self.visible[x1:x1 + window.shape[0], y1:y1 + window.shape[1]] = window
+        return self.visible
+    
+    def is_visible(self, x, y):
+        """
+        :return: boolean True if the location is in the current fov
+        """
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return bool(self.visible[x, y])
+        return False
+    
+    def invalidate(self, x, y, width, height):
+        """
+        Tile listener: drop every result whose window overlaps the changed rectangle
+        :return: None
+        """
+        for key in [(ox, oy, radius) for (ox, oy, radius) in self.entries
+                    if ox - radius < x + width and x <= ox + radius and oy - radius < y + height and y <= oy + radius]:
+            del self.entries[key]
+
+
+class Perception:
+    def __init__(self, game_map, radius, max_entries=16):
+        """
+        What monsters can see, answered for all of them at once
+        Sight uses symmetric shadowcasting, so a monster can see the target (the player) exactly when the target can
+        see the monster: one fov from the target, out to the longest sight radius, covers every monster's check
+        :param game_map: GameMap object
+        :param radius: int longest sight radius of any monster
+        :param max_entries: int number of fov results to keep cached
+        """
+        self.radius = radius
+        self.fov_cache = FovCache(fov_map=initialize_fov(game_map=game_map), game_map=game_map,
+                                  max_entries=max_entries, algorithm=libtcod.FOV_SYMMETRIC_SHADOWCAST)
+        self.target = None
+    
+    def update(self, x, y):
+        """
+        Centre perception on the target, once per turn (a cache hit if the target hasn't moved)
+        :return: None
+        """
+        self.fov_cache.compute(x=x, y=y, radius=self.radius)
+        self.target = (x, y)
+    
+    def can_see(self, x, y, radius):
+        """
+        :param x: x location of the observer
+        :param y: y location of the observer
+        :param radius: int sight radius of the observer (at most self.radius)
+        :return: boolean True if the observer can see the target
+        """
+        # strictly inside the radius, the same cut off libtcod's fov uses
+        (target_x, target_y) = self.target
+        return self.fov_cache.is_visible(x, y) and (x - target_x) ** 2 + (y - target_y) ** 2 < radius ** 2
+    
+    def get_observers(self, xs, ys, radii):
+        """
+        Batched can_see
+        :param xs: int array of observer x locations
+        :param ys: int array of observer y locations
+        :param radii: int array of observer sight radii
+        :return: boolean array, True for observers that can see the target
+        """
+        (target_x, target_y) = self.target
+        xs, ys, radii = np.asarray(xs), np.asarray(ys), np.asarray(radii)
+        on_map = (xs >= 0) & (xs < self.fov_cache.width) & (ys >= 0) & (ys < self.fov_cache.height)
+        visible = np.zeros(xs.shape, dtype=bool)
+        visible[on_map] = self.fov_cache.visible[xs[on_map], ys[on_map]]
+        return visible & ((xs - target_x) ** 2 + (ys - target_y) ** 2 < radii ** 2)
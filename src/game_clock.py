@@ -0,0 +1,19 @@
+class GameClock:
+    def __init__(self, turn=0):
+        """
+        Global turn counter: cooldowns are stored as the turn they run out on, so nothing needs ticking every turn
+        :param turn: int turn to start counting from
+        """
+        self.turn = turn
+    
+    def advance(self, turns=1):
+        """
+        Move the clock forward, which ticks every cooldown on the level at once
+        :param turns: int number of turns that have passed
+        :return: None
+        """
+        self.turn += turns
+
+
+# the clock every PartyMember's cooldown is measured against, moved forward by the engine as turns pass
+game_clock = GameClock()
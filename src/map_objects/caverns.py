@@ -1,5 +1,9 @@
-from queue import Queue
-from random import randint, choice
+from collections import deque
+from random import getrandbits, getstate, setstate, seed as random_seed
+
+import numpy as np
+
+from src.map_objects.tile_index import TileIndex
 
 
 life_directions = {(-1, -1), (-1, 0), (-1, 1), (0, 1),
@@ -7,23 +11,71 @@ life_directions = {(-1, -1), (-1, 0), (-1, 1), (0, 1),
 
 ortho_directions = {(1, 0), (0, 1), (-1, 0), (0, -1)}
 
+# same as ortho_directions, but in a fixed order so a direction can be stored as an index
+ortho_steps = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+
 
 class LifeMap:
     def __init__(self, map_width, map_height):
         """
-        Creates a new map (list of lists) and initializes it to all random, except for a filled border
+        Creates a new map and initializes it to all "live" (filled) tiles
+        The map is a contiguous numpy boolean array (1 byte per tile) indexed [x][y], True for "live" / wall
         :param map_width: width of map
         :param map_height: height of map
         """
         self.width = map_width
         self.height = map_height
-        self.alive = [[True for y in range(self.height)] for x in range(self.width)]
+        self.alive = np.ones((self.width, self.height), dtype=bool)
+    
+    @classmethod
+    def from_array(cls, alive):
+        """
+        Creates a new map from an existing 2d boolean array (the array is copied)
+        :param alive: 2d boolean array indexed [x][y]
+        :return: new LifeMap object
+        """
+        width, height = np.shape(alive)
+        grid = cls(map_width=width, map_height=height)
+        grid.alive[:] = alive
+        return grid
     
     def make_random(self):
-        for x in range(1, self.width - 1):
-            for y in range(1, self.height - 1):
-                if randint(0, 1):
-                    self.alive[x][y] = False
+        """
+        Randomizes every tile except for the filled border, in a single bulk fill
+        The generator is seeded from the random module so random.seed() still reproduces a map
+        :return: None
+        """
+        rng = np.random.default_rng(getrandbits(64))
+        self.alive[1:-1, 1:-1] = rng.integers(0, 2, size=(self.width - 2, self.height - 2), dtype=np.uint8) == 0
+    
+    def copy(self):
+        """
+        Bulk copy of the map
+        :return: new LifeMap object
+        """
+        return LifeMap.from_array(self.alive)
+    
+    def floor(self):
+        """
+        :return: 2d boolean array, True for every "dead" (open floor) tile
+        """
+        return ~self.alive
+    
+    def carve(self, mask):
+        """
+        Bulk set every tile in a mask as "dead" (open floor)
+        :param mask: 2d boolean array the same shape as the map
+        :return: None
+        """
+        self.alive &= ~mask
+    
+    def fill(self, mask):
+        """
+        Bulk set every tile in a mask as "live" (wall)
+        :param mask: 2d boolean array the same shape as the map
+        :return: None
+        """
+        self.alive |= mask
 
 
 def carve_tile_sets(grid, tile_sets):
@@ -45,98 +97,113 @@ def carve_tiles(grid, tiles):
     :param tiles: list of tuples representing unconnected caverns
     :return: modified grid
     """
-    for (x, y) in tiles:
-        grid.alive[x][y] = False
+    if tiles:
+        xs, ys = zip(*tiles)
+        grid.alive[list(xs), list(ys)] = False
     return grid
 
 
-def connect_caverns_closest(grid, caverns, min_cavern_size):
+def connect_caverns_mst(grid):
     """
-    Connect caverns using closest tiles rather than random tiles
-     - strategy: sort the caverns smallest to largest
-     - start with the smallest cavern
-     - flood fill neighboring WALLS until a FLOOR neighbor is detected that is NOT part of current cavern
-     - THAT floor neighbor is the closest point
-     - check point against original cavern tile points for distance set of smallest distances
-     - choose one of those closest points to connect to
-     - repeat for next largest cavern (re-sort caverns) until there is only one cavern
-    :param grid: current LifeMap Object
-    :param caverns: list of list of tuples representing unconnected caverns
-    :param min_cavern_size: int minimum number of tiles in a cavern
+    Connect all caverns in a single pass, choosing corridors as a minimum spanning tree
+     - grow a distance field through the WALLS out of every cavern at once, remembering which cavern reached each wall
+     - wherever two neighboring tiles were reached from different caverns, a corridor could join those two caverns
+     - keep the shortest possible corridor for each pair of caverns
+     - pick corridors shortest first, skipping any that join caverns that are already connected (Kruskal)
+     - carve each chosen corridor by walking both sides of its meeting point back to their caverns
+    :param grid: current LifeMap Object (corridors are carved into it)
     :return: list of tuple int x y coordinates (corridors)
     """
+    labels, sizes, coordinates = label_caverns(grid)
+    if len(coordinates) < 2:
+        return []
+    
+    origins, distances, steps = get_wall_distance_field(grid=grid, labels=labels)
+    
+    # candidate corridors: neighboring tiles reached from different caverns
+    edge_costs, edge_caverns, edge_tiles = [], [], []
+    for (dx, dy) in ((1, 0), (0, 1)):
+        origins_a, origins_b = origins[:grid.width - dx, :grid.height - dy], origins[dx:, dy:]
+        meets = (origins_a > 0) & (origins_b > 0) & (origins_a != origins_b)
+        xs, ys = np.nonzero(meets)
+        edge_costs.append(distances[xs, ys] + distances[xs + dx, ys + dy])
+        edge_caverns.append(np.sort(np.stack((origins_a[meets], origins_b[meets]), axis=1), axis=1))
+        edge_tiles.append(np.stack((xs, ys, xs + dx, ys + dy), axis=1))
+    edge_costs = np.concatenate(edge_costs)
+    edge_caverns = np.concatenate(edge_caverns)
+    edge_tiles = np.concatenate(edge_tiles)
+    
+    # shortest candidate for each pair of caverns, then all pairs shortest first
+    order = np.lexsort((edge_costs, edge_caverns[:, 1], edge_caverns[:, 0]))
+    first = np.unique(edge_caverns[order], axis=0, return_index=True)[1]
+    best = order[first]
+    best = best[np.argsort(edge_costs[best], kind='stable')]
+    
+    parents = list(range(len(coordinates) + 1))
     all_corridors = []
-    while len(caverns) > 1:
-        caverns.sort(key=len)
-        closest = explore_walls_iterative_ortho(grid, caverns[0])
-        target = find_nearest_point_in_cavern(closest, caverns[0])
-        corridors = connect_caverns_random_walk(closest, target)
-        all_corridors.extend(corridors)
-        carve_tiles(grid=grid, tiles=corridors)
-        
-        # get new list of caverns
-        grid, caverns = fill_small_caverns(grid=grid, min_cavern_size=min_cavern_size)
+    for (cavern_a, cavern_b), (ax, ay, bx, by) in zip(edge_caverns[best].tolist(), edge_tiles[best].tolist()):
+        root_a = find_root(parents, cavern_a)
+        root_b = find_root(parents, cavern_b)
+        if root_a != root_b:
+            parents[root_b] = root_a
+            corridor = trace_corridor(steps=steps, distances=distances, x=ax, y=ay)[::-1]
+            corridor.extend(trace_corridor(steps=steps, distances=distances, x=bx, y=by))
+            all_corridors.extend(corridor)
     
+    all_corridors = list(dict.fromkeys(all_corridors))
+    carve_tiles(grid=grid, tiles=all_corridors)
     return all_corridors
 
 
-def connect_caverns_random_walk(closest, target):
+def get_wall_distance_field(grid, labels):
     """
-    Chooses a random coordinate in each separate cavern set,
-    and then connects those points in a random-walk algorithm,
-    setting to false as it progresses
-    :param closest: tuple representing starting point of walk
-    :param target: tuple representing ending point of walk
-    :return: list of tuple int x y coordinates (corridors)
+    Multi-source breadth first search through the walls, starting from every cavern at once
+    (the map border is never entered, so corridors can't break through the edge of the map)
+    :param grid: LifeMap object
+    :param labels: 2d int array of cavern labels, from label_caverns
+    :return: 2d int array of the cavern that reached each tile (0 if unreached),
+             2d int array of distance to that cavern (0 for cavern tiles),
+             2d int array of the ortho_steps index used to step into each wall tile (-1 for cavern tiles)
+    """
+    origins = labels.copy()
+    distances = np.zeros(labels.shape, dtype=np.int32)
+    steps = np.full(labels.shape, -1, dtype=np.int8)
+    
+    open_walls = np.zeros(labels.shape, dtype=bool)
+    open_walls[1:-1, 1:-1] = grid.alive[1:-1, 1:-1]
+    frontier = labels > 0
+    distance = 0
+    
+    while frontier.any():
+        distance += 1
+        next_frontier = np.zeros(labels.shape, dtype=bool)
+        for index, (dx, dy) in enumerate(ortho_steps):
+            # np.roll wraps around, but the border is never part of the frontier or of open_walls
+            reached = np.roll(frontier, (dx, dy), axis=(0, 1)) & open_walls & (origins == 0)
+            origins[reached] = np.roll(origins, (dx, dy), axis=(0, 1))[reached]
+            distances[reached] = distance
+            steps[reached] = index
+            next_frontier |= reached
+        frontier = next_frontier
+    
+    return origins, distances, steps
+
+
+def trace_corridor(steps, distances, x, y):
     """
-    corridors = []
-    (x1, y1) = closest
-    (x2, y2) = target
-    while (x1, y1) != (x2, y2):
-        if x1 == x2:  # move y
-            if y1 < y2:
-                y1 += 1
-            else:
-                y1 -= 1
-        elif y1 == y2:  # move x
-            if x1 < x2:
-                x1 += 1
-            else:
-                x1 -= 1
-        else:
-            if randint(0, 1):  # randomly pick x or y
-                if y1 < y2:
-                    y1 += 1
-                else:
-                    y1 -= 1
-            else:
-                if x1 < x2:
-                    x1 += 1
-                else:
-                    x1 -= 1
-        corridors.append((x1, y1))
-    corridors.remove(target)
-    return corridors
-
-
-def find_nearest_point_in_cavern(start, cavern):
-    """
-    compare orthogonal distances between a point and a set of another points to find closest
-    :param start: tile coordinates
-    :param cavern: list of tiles in a cavern
-    :return: target coordinate
-    """
-    target = cavern[0]
-    (x1, y1) = start
-    (x2, y2) = target
-    cavern.remove(target)
-    shortest_dist = distance_to(x1=x1, y1=y1, x2=x2, y2=y2)
-    for (x2, y2) in cavern:
-        distance = distance_to(x1=x1, y1=y1, x2=x2, y2=y2)
-        if distance < shortest_dist:
-            shortest_dist = distance
-            target = (x2, y2)
-    return target
+    Walks from a wall tile back to the cavern that reached it in the wall distance field
+    :param steps: 2d int array of ortho_steps indexes, from get_wall_distance_field
+    :param distances: 2d int array of distances, from get_wall_distance_field
+    :param x: x coordinate to start from
+    :param y: y coordinate to start from
+    :return: list of tuple int x y wall coordinates, starting at (x, y) and ending next to the cavern
+    """
+    tiles = []
+    while distances[x, y] > 0:
+        tiles.append((x, y))
+        (dx, dy) = ortho_steps[steps[x, y]]
+        x, y = x - dx, y - dy
+    return tiles
 
 
 def cleanup(grid, min_cavern_size):
@@ -146,12 +213,7 @@ def cleanup(grid, min_cavern_size):
     :param min_cavern_size: int minimum size of unconnected
     :return: modified copy of grid, list of lists of tuple int x y coordinates
     """
-    new_grid = LifeMap(map_width=grid.width, map_height=grid.height)
-    # copy grid
-    for x in range(grid.width):
-        for y in range(grid.height):
-            if not grid.alive[x][y]:
-                new_grid.alive[x][y] = False
+    new_grid = grid.copy()
     
     # get a map without the small caverns, with all valid caverns connected
     new_grid, valid_caverns = fill_small_caverns(grid=new_grid, min_cavern_size=min_cavern_size)
@@ -166,20 +228,84 @@ def fill_small_caverns(grid, min_cavern_size):
     :param min_cavern_size: int minimum cavern size to keep
     :return: current lifeMap object, list of lists of tuple int x y locations
     """
-    cavern_tiles = []  # holds sets of all coordinates in largest caverns found so far
-    explored = []
+    labels, sizes, coordinates = label_caverns(grid)
+    keep = sizes >= min_cavern_size
+    keep[0] = False
+    
     new_grid = LifeMap(map_width=grid.width, map_height=grid.height)
-    for x in range(new_grid.width):
-        for y in range(new_grid.height):
-            if (x, y) not in cavern_tiles and (x, y) not in explored and not grid.alive[x][y]:
-                # get all tiles in this cave system
-                new_cave_tiles = explore_cavern_iterative_ortho(grid, x, y)
-                # compare size of new cave tiles to current tile
-                explored.extend(new_cave_tiles)
-                if len(new_cave_tiles) >= min_cavern_size:
-                    cavern_tiles.append(new_cave_tiles)
-    new_map = carve_tile_sets(grid=new_grid, tile_sets=cavern_tiles)
-    return new_map, cavern_tiles
+    new_grid.carve(keep[labels])
+    
+    cavern_tiles = [list(zip(xs.tolist(), ys.tolist()))
+                    for label, (xs, ys) in enumerate(coordinates, start=1) if keep[label]]
+    return new_grid, cavern_tiles
+
+
+def label_caverns(grid):
+    """
+    Labels every enclosed cavern (orthogonally connected "dead" tiles) in a single O(cells) pass
+     - split each column into vertical runs of floor tiles
+     - union the runs that touch across neighboring columns (union-find over runs, not over tiles)
+     - number the caverns in scan order, the same order a tile by tile scan would find them in
+    :param grid: LifeMap object
+    :return: 2d int array of labels (0 for walls, 1..n for caverns), int array of cavern sizes indexed by label,
+             list of (xs, ys) coordinate arrays for labels 1..n
+    """
+    floor = grid.floor()
+    run_starts = floor.copy()
+    run_starts[:, 1:] &= ~floor[:, :-1]
+    runs = np.cumsum(run_starts, dtype=np.int64).reshape(floor.shape)
+    runs[~floor] = 0
+    run_count = int(runs.max()) if runs.size else 0
+    
+    parents = list(range(run_count + 1))
+    touching = floor[:-1] & floor[1:]
+    pairs = np.unique(np.stack((runs[:-1][touching], runs[1:][touching]), axis=1), axis=0)
+    for (run_a, run_b) in pairs.tolist():
+        root_a = find_root(parents, run_a)
+        root_b = find_root(parents, run_b)
+        if root_a != root_b:
+            # always keep the earliest run as the root, so labels come out in scan order
+            parents[max(root_a, root_b)] = min(root_a, root_b)
+    
+    roots = np.array([find_root(parents, run) for run in range(run_count + 1)], dtype=np.int64)
+    run_labels = np.unique(roots, return_inverse=True)[1].reshape(-1)
+    labels = run_labels[runs]
+    
+    counts = np.bincount(labels.ravel(), minlength=int(run_labels.max()) + 1)
+    sizes = counts.copy()
+    sizes[0] = 0
+    
+    coordinates = get_label_coordinates(labels=labels, counts=counts)[1:]
+    return labels, sizes, coordinates
+
+
+def get_label_coordinates(labels, counts):
+    """
+    Groups the coordinates of a label grid by label with a single stable sort (tiles stay in scan order)
+    :param labels: 2d int array of non-negative labels
+    :param counts: int array of the number of tiles for each label
+    :return: list of (xs, ys) coordinate arrays indexed by label
+    """
+    order = np.argsort(labels, axis=None, kind='stable')
+    ends = np.cumsum(counts)
+    coordinates = []
+    for label in range(len(counts)):
+        xs, ys = np.unravel_index(order[ends[label] - counts[label]:ends[label]], labels.shape)
+        coordinates.append((xs, ys))
+    return coordinates
+
+
+def find_root(parents, item):
+    """
+    Union-find lookup with path halving
+    :param parents: list of int parent indexes
+    :param item: int index to find the root of
+    :return: int root index
+    """
+    while parents[item] != item:
+        parents[item] = parents[parents[item]]
+        item = parents[item]
+    return item
 
 
 def get_starting_seeds(caverns, min_cavern_size, zone_seed_min_distance):
@@ -196,11 +322,11 @@ def get_starting_seeds(caverns, min_cavern_size, zone_seed_min_distance):
     """
     seeds = []
     for cavern in caverns:
-        valid_seeds = cavern
+        valid_seeds = TileIndex(tiles=cavern, bucket_size=zone_seed_min_distance)
         cavern_seed_count = len(cavern) // min_cavern_size
         
         while valid_seeds and len(valid_seeds) >= cavern_seed_count:
-            seed = choice(valid_seeds)
+            seed = valid_seeds.random_choice()
             seeds.append(seed)
             valid_seeds.remove(seed)
             valid_seeds = remove_closest_candidates(seed=seed, candidates=valid_seeds,
@@ -274,17 +400,17 @@ def explore_cavern_iterative(grid, x, y):
     :param y: y coordinate
     :return: list of tuple x y coordinates
     """
-    frontier = Queue()
-    frontier.put((x, y))
+    frontier = deque([(x, y)])
     visited = [(x, y)]
+    seen = {(x, y)}
     
-    while not frontier.empty():
-        current = frontier.get()
-        x, y = current
+    while frontier:
+        x, y = frontier.popleft()
         for neighbor in get_neighbors_list(grid, x, y, state=False):
-            if neighbor not in visited:
-                frontier.put(neighbor)
+            if neighbor not in seen:
+                frontier.append(neighbor)
                 visited.append(neighbor)
+                seen.add(neighbor)
     return visited
 
 
@@ -296,80 +422,55 @@ def explore_cavern_iterative_ortho(grid, x, y):
     :param y: y coordinate
     :return: list of tuple x y coordinates
     """
-    frontier = Queue()
-    frontier.put((x, y))
+    frontier = deque([(x, y)])
     visited = [(x, y)]
+    seen = {(x, y)}
     
-    while not frontier.empty():
-        current = frontier.get()
-        x, y = current
+    while frontier:
+        x, y = frontier.popleft()
         for neighbor in get_neighbors_list_ortho(grid, x, y, state=False):
-            if neighbor not in visited:
-                frontier.put(neighbor)
+            if neighbor not in seen:
+                frontier.append(neighbor)
                 visited.append(neighbor)
+                seen.add(neighbor)
     return visited
 
 
-def explore_walls_iterative_ortho(grid, tile_set):
+def get_neighbor_counts(alive):
     """
-    Iteratively explores walls from a set of points,
-     - returns a list of all coordinates in that cavern - orthogonal version
-    :param grid: LifeMap object
-    :param tile_set: list of tuple int x y coordinates
-    :return: closest "live" coordinates of next cave
-    """
-    frontier = Queue()
-    visited = []
-    closest = None
-    
-    for (x, y) in tile_set:
-        visited.append((x, y))
-        if get_neighbors_list_ortho(grid, x, y, state=True):
-            frontier.put((x, y))
-    while not frontier.empty() and not closest:
-        current = frontier.get()
-        x, y = current
-        neighbors = []
-        for (dx, dy) in ortho_directions:
-            if (x + dx) in range(grid.width) and (y + dy) in range(grid.height):
-                neighbors.append((x + dx, y + dy))
-        for neighbor in neighbors:
-            (x, y) = neighbor
-            if (x, y) not in visited:
-                if grid.alive[x][y]:
-                    frontier.put(neighbor)
-                    visited.append(neighbor)
-                else:
-                    closest = (x, y)
-                    break
-    return closest
+    Counts the "live" neighbors of every interior cell in a single pass - diagonal version
+    Each of the 8 neighbor directions is a shifted slice of the same array, so the counts are a sum of 8 slices
+    :param alive: 2d numpy boolean array indexed [x][y]
+    :return: 2d numpy array of neighbor counts for the interior cells (border excluded)
+    """
+    width, height = alive.shape
+    counts = np.zeros((width - 2, height - 2), dtype=np.uint8)
+    for (dx, dy) in life_directions:
+        counts += alive[1 + dx:width - 1 + dx, 1 + dy:height - 1 + dy]
+    return counts
 
 
 def cycle(grid, survive_min, survive_max, resurrect_min, resurrect_max):
     """
     Heart of the Conway's Game Of Life algorithm for our purposes
     (credit to https://gridbugs.org/cellular-automata-cave-generation/)
-    :param grid: list of lists of booleans denoting map
+    Neighbor counts for the whole map are computed at once, and the survive / resurrect rules applied as masks
+    :param grid: LifeMap object
     :param survive_min: minimum number of neighbors needed to keep state
     :param survive_max: maximum number of neighbors allowed to keep state
     :param resurrect_min: minimum number of neighbors needed to change state
     :param resurrect_max: maximum number of neighbors allowed to change state
     :return: current lifeMap object after iteration
     """
+    alive = grid.alive
+    neighbor_counts = get_neighbor_counts(alive)
+    interior = alive[1:-1, 1:-1]
+    
+    survives = interior & (survive_min <= neighbor_counts) & (neighbor_counts <= survive_max)
+    resurrects = ~interior & (resurrect_min <= neighbor_counts) & (neighbor_counts <= resurrect_max)
+    
     next_grid = LifeMap(map_width=grid.width, map_height=grid.height)
-    for x in range(1, grid.width - 1):
-        for y in range(1, grid.height - 1):
-            neighbor_count = get_neighbor_count(grid=grid, x=x, y=y, state=True)
-            if grid.alive[x][y]:
-                if survive_min <= neighbor_count <= survive_max:
-                    next_grid.alive[x][y] = True
-                else:
-                    next_grid.alive[x][y] = False
-            else:
-                if resurrect_min <= neighbor_count <= resurrect_max:
-                    next_grid.alive[x][y] = True
-                else:
-                    next_grid.alive[x][y] = False
+    next_grid.alive[1:-1, 1:-1] = survives | resurrects
     return next_grid
 
 
@@ -380,72 +481,82 @@ def make_zones(grid, starting_seeds):
     :param starting_seeds: list of tuple int x y coordinates (one from each "cavern")
     :return: list of lists of tuple int x y coordinates
     """
-    # copy map
-    taken_grid = LifeMap(grid.width, grid.height)
-    for x in range(grid.width):
-        for y in range(grid.height):
-            if not grid.alive[x][y] or (x, y) in starting_seeds:
-                taken_grid.alive[x][y] = False
-    
-    # convert lifeMap object into a list of valid coordinates
-    grid_list = []
-    for x in range(grid.width):
-        for y in range(grid.height):
-            if not grid.alive[x][y]:
-                grid_list.append((x, y))
-    
-    # change list of seed tuples into a list of lists
-    zones = []
-    for seed in starting_seeds:
-        zones.append([seed])
-    
-    # grow seeds into zones, until there are no more valid coordinates to choose from
-    while grid_list:
-        zones, grid_list = grow_zones(zones=zones, grid_list=grid_list, grid=grid)
-    
+    zone_grid, zones, sizes, centroids = partition_zones(grid=grid, starting_seeds=starting_seeds)
     return zones
 
 
-def grow_zones(zones, grid_list, grid):
+def partition_zones(grid, starting_seeds):
+    """
+    Grows all zone seeds at once with a multi-source breadth first search, one ring of tiles per step.
+    A tile reached by more than one zone in the same step goes to the lowest numbered zone.
+    :param grid: LifeMap object
+    :param starting_seeds: list of tuple int x y coordinates
+    :return: 2d int array of zone ids (-1 for tiles in no zone), list of lists of tuple int x y coordinates,
+             int array of zone sizes, list of tuple float x y zone centroids
     """
-    Iterate through zones tile by tile, appending each tile's valid neighbors to it's zone
+    zone_grid = np.full((grid.width, grid.height), -1, dtype=np.int32)
+    if not starting_seeds:
+        return zone_grid, [], np.zeros(0, dtype=np.int64), []
+    
+    seed_xs, seed_ys = np.array(starting_seeds).T
+    zone_grid[seed_xs, seed_ys] = np.arange(len(starting_seeds))
+    unclaimed = grid.floor() & (zone_grid < 0)
+    frontier = zone_grid >= 0
+    no_zone = np.iinfo(np.int32).max
+    
+    while frontier.any():
+        frontier_ids = np.where(frontier, zone_grid, no_zone)
+        claims = np.full(zone_grid.shape, no_zone, dtype=np.int32)
+        np.minimum(claims[1:, :], frontier_ids[:-1, :], out=claims[1:, :])
+        np.minimum(claims[:-1, :], frontier_ids[1:, :], out=claims[:-1, :])
+        np.minimum(claims[:, 1:], frontier_ids[:, :-1], out=claims[:, 1:])
+        np.minimum(claims[:, :-1], frontier_ids[:, 1:], out=claims[:, :-1])
+        frontier = unclaimed & (claims != no_zone)
+        zone_grid[frontier] = claims[frontier]
+        unclaimed &= ~frontier
+    
+    in_zone = zone_grid >= 0
+    zone_ids = zone_grid[in_zone]
+    zone_count = len(starting_seeds)
+    sizes = np.bincount(zone_ids, minlength=zone_count)
+    tile_xs, tile_ys = np.nonzero(in_zone)
+    centroid_xs = np.bincount(zone_ids, weights=tile_xs, minlength=zone_count) / sizes
+    centroid_ys = np.bincount(zone_ids, weights=tile_ys, minlength=zone_count) / sizes
+    centroids = list(zip(centroid_xs.tolist(), centroid_ys.tolist()))
+    
+    # zone_grid + 1 puts tiles without a zone in label 0
+    counts = np.concatenate(([zone_grid.size - len(zone_ids)], sizes))
+    zones = [list(zip(xs.tolist(), ys.tolist()))
+             for (xs, ys) in get_label_coordinates(labels=zone_grid + 1, counts=counts)[1:]]
+    return zone_grid, zones, sizes, centroids
+
+
+def get_zone_grid(map_width, map_height, zones):
+    """
+    Converts a list of zones into a grid of zone ids, for O(1) "which zone is (x, y) in" lookups
+    :param map_width: width of map
+    :param map_height: height of map
     :param zones: list of lists of tuple int x y coordinates
-    :param grid_list: list of available tiles
-    :param grid: LifeMap object (array of array of booleans)
-    :return: new list of zones, list of valid coordinates
-    """
-    zone_list = []
-    for zone in zones:
-        new_zone = []
-        for (x, y) in zone:
-            new_zone.append((x, y))
-            neighbors = get_neighbors_list_ortho(grid=grid, x=x, y=y, state=False)
-            for neighbor in neighbors:
-                if neighbor in grid_list:
-                    new_zone.append(neighbor)
-                    grid_list.remove(neighbor)
-        zone_list.append(new_zone)
-    return zone_list, grid_list
+    :return: 2d int array of zone ids (-1 for tiles in no zone)
+    """
+    zone_grid = np.full((map_width, map_height), -1, dtype=np.int32)
+    for zone_id, zone in enumerate(zones):
+        if zone:
+            xs, ys = zip(*zone)
+            zone_grid[list(xs), list(ys)] = zone_id
+    return zone_grid
 
 
 def remove_closest_candidates(seed, candidates, zone_seed_min_distance):
     """
     Removes all candidates with orthogonal distance smaller than the given min distance
     :param seed: tuple x y int coordinates
-    :param candidates: list of tuple x y int coordinates that can be removed
+    :param candidates: TileIndex of tuple x y int coordinates that can be removed
     :param zone_seed_min_distance: minimum distance coordinates must be from seed
-    :return: list of tuple x y int valid candidates
+    :return: TileIndex of tuple x y int valid candidates
     """
-    good_list = []
-    (x1, y1) = seed
-    for candidate in candidates:
-        (x2, y2) = candidate
-        good_candidate = True
-        if distance_to(x1, y1, x2, y2) < zone_seed_min_distance:
-            good_candidate = False
-        if good_candidate:
-            good_list.append(candidate)
-    return good_list
+    candidates.remove_within(seed, zone_seed_min_distance)
+    return candidates
 
 
 def furthest_candidate_from_all_seeds(seeds, candidates):
@@ -455,16 +566,7 @@ def furthest_candidate_from_all_seeds(seeds, candidates):
     :param candidates: list of int x y coordinate tuples
     :return: tuple x y int coordinates
     """
-    furthest_dist = 0
-    furthest_candidate = (None, None)
-    for (x1, y1) in candidates:
-        current_dist = 0
-        for (x2, y2) in seeds:
-            current_dist += distance_to(x1, y1, x2, y2)
-            if current_dist > furthest_dist:
-                furthest_dist = current_dist
-                furthest_candidate = (x1, y1)
-    return furthest_candidate
+    return TileIndex(tiles=candidates).farthest_from_all(seeds)
 
 
 def distance_to(x1, y1, x2, y2):
@@ -482,7 +584,18 @@ def distance_to(x1, y1, x2, y2):
 
 
 def create_caverns(map_width, map_height, survive_min, survive_max, resurrect_min, resurrect_max, iterations,
-                   zone_seed_min_distance, min_cavern_size):
+                   zone_seed_min_distance, min_cavern_size, seed=None):
+    if seed is not None:
+        # generate from a fixed seed, without disturbing the game's own random sequence
+        state = getstate()
+        random_seed(seed)
+        try:
+            return create_caverns(map_width=map_width, map_height=map_height, survive_min=survive_min,
+                                  survive_max=survive_max, resurrect_min=resurrect_min, resurrect_max=resurrect_max,
+                                  iterations=iterations, zone_seed_min_distance=zone_seed_min_distance,
+                                  min_cavern_size=min_cavern_size)
+        finally:
+            setstate(state)
 
     # create random LifeMap object
     life_map = LifeMap(map_width=map_width, map_height=map_height)
@@ -503,7 +616,6 @@ def create_caverns(map_width, map_height, survive_min, survive_max, resurrect_mi
     zones = make_zones(grid=life_map, starting_seeds=starting_seeds)
     
     # connect zones
-    corridors = connect_caverns_closest(grid=life_map, caverns=caverns, min_cavern_size=min_cavern_size)
-    carve_tiles(grid=life_map, tiles=corridors)
+    corridors = connect_caverns_mst(grid=life_map)
     
     return life_map, zones, corridors
@@ -0,0 +1,269 @@
+from random import getstate, setstate, seed as random_seed
+
+import numpy as np
+
+from src.map_objects.caverns import LifeMap, cycle, label_caverns, connect_caverns_mst, get_starting_seeds, \
+    partition_zones
+
+# salts keep the different uses of the world seed independent of each other
+NOISE_SALT = 1
+VERTICAL_PORTAL_SALT = 2
+HORIZONTAL_PORTAL_SALT = 3
+CHUNK_SALT = 4
+
+
+def mix_hash(seed, xs, ys, salt):
+    """
+    Deterministic integer hash of world coordinates (splitmix64 finalizer), the same on every machine and run
+    :param seed: int world seed
+    :param xs: int array of x coordinates
+    :param ys: int array of y coordinates (same shape as xs)
+    :param salt: int to tell different uses of the hash apart
+    :return: uint64 array of hashes
+    """
+    with np.errstate(over='ignore'):
+        h = np.asarray(xs, dtype=np.int64).astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+        h ^= np.asarray(ys, dtype=np.int64).astype(np.uint64) * np.uint64(0xC2B2AE3D27D4EB4F)
+        h ^= np.uint64((seed * 0x165667B1 + salt) & 0xFFFFFFFFFFFFFFFF)
+        h ^= h >> np.uint64(30)
+        h *= np.uint64(0xBF58476D1CE4E5B9)
+        h ^= h >> np.uint64(27)
+        h *= np.uint64(0x94D049BB133111EB)
+        h ^= h >> np.uint64(31)
+    return h
+
+
+def hash_int(seed, x, y, salt):
+    """
+    :return: python int hash of a single coordinate
+    """
+    return int(mix_hash(seed, np.array([x]), np.array([y]), salt)[0])
+
+
+class Chunk:
+    def __init__(self, cx, cy, size, blocked, zones, zone_grid, corridors, zone_offset=0):
+        """
+        One generated square of the world
+        :param cx: chunk x coordinate (world x // size)
+        :param cy: chunk y coordinate (world y // size)
+        :param size: int width and height of the chunk
+        :param blocked: 2d boolean array, True for walls
+        :param zones: list of lists of tuple int x y world coordinates
+        :param zone_grid: 2d int array of indexes into zones (-1 for tiles in no zone)
+        :param corridors: list of tuple int x y world coordinates
+        :param zone_offset: int index of this chunk's first zone in a list of zones from every chunk
+        """
+        self.cx = cx
+        self.cy = cy
+        self.x = cx * size
+        self.y = cy * size
+        self.size = size
+        self.blocked = blocked
+        self.zones = zones
+        self.zone_grid = zone_grid
+        self.corridors = corridors
+        self.zone_offset = zone_offset
+
+
+class ChunkGenerator:
+    def __init__(self, seed, chunk_size, survive_min, survive_max, resurrect_min, resurrect_max, iterations,
+                 zone_seed_min_distance, min_cavern_size):
+        """
+        Generates caverns one chunk at a time, so the world never has to be generated (or held in memory) all at once
+         - the starting noise is a hash of world coordinates, so any region can be rebuilt on its own
+         - the life cycles run on the chunk plus a halo of `iterations` tiles, so tiles at the seams come out
+           exactly as they would on one big map
+         - every chunk edge gets a "portal" tile at an offset both neighbors agree on, and everything in a chunk is
+           connected to its portals, so caverns stay connected across chunk boundaries
+        :param seed: int world seed
+        :param chunk_size: int width and height of a chunk
+        """
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.survive_min = survive_min
+        self.survive_max = survive_max
+        self.resurrect_min = resurrect_min
+        self.resurrect_max = resurrect_max
+        self.iterations = iterations
+        self.zone_seed_min_distance = zone_seed_min_distance
+        self.min_cavern_size = min_cavern_size
+    
+    def get_noise(self, x, y, width, height):
+        """
+        Random starting state for any rectangle of the world
+        :return: 2d boolean array indexed [x][y], True for "live" tiles
+        """
+        xs, ys = np.meshgrid(np.arange(x, x + width), np.arange(y, y + height), indexing='ij')
+        return (mix_hash(self.seed, xs, ys, NOISE_SALT) >> np.uint64(32)) & np.uint64(1) == 0
+    
+    def get_portal(self, x, y, salt, start=None, low=None, high=None):
+        """
+        Offset along a chunk edge for the portal tile, the same for both chunks sharing the edge
+        :param start: world coordinate of the edge's first tile, if the portal has to land in low .. high
+        :param low: lowest world coordinate the portal may land on (inside the map's outer wall), or None
+        :param high: highest world coordinate the portal may land on, or None
+        :return: int offset in 1 .. chunk_size - 2, or None if no part of the edge is inside the map
+        """
+        hash_value = hash_int(self.seed, x, y, salt)
+        offset = 1 + hash_value % (self.chunk_size - 2)
+        if low is None or low <= start + offset <= high:
+            return offset
+        # keep the portal on the part of the edge inside the map, so the chunks either side still connect
+        first, last = max(1, low - start), min(self.chunk_size - 2, high - start)
+        if first > last:
+            return None
+        return first + hash_value % (last - first + 1)
+    
+    def generate(self, cx, cy, bounds=None):
+        """
+        Build a single chunk
+        :param cx: chunk x coordinate
+        :param cy: chunk y coordinate
+        :param bounds: (x, y, width, height) of the map the chunk is for, or None for no limit (width or height may
+                       also be None) - tiles on or past the map's edge are walled off before the caverns are connected
+        :return: Chunk object
+        """
+        size = self.chunk_size
+        halo = self.iterations
+        (left, top, width, height) = bounds or (0, 0, None, None)
+        # world coordinates of the first and last open tile allowed on each axis (None for no limit)
+        (x_low, x_high) = (left + 1, left + width - 2) if width is not None else (None, None)
+        (y_low, y_high) = (top + 1, top + height - 2) if height is not None else (None, None)
+        
+        # life cycles over the chunk plus its halo - each cycle leaves one more ring of the halo out of date
+        life_map = LifeMap.from_array(self.get_noise(cx * size - halo, cy * size - halo, size + 2 * halo,
+                                                     size + 2 * halo))
+        for i in range(self.iterations):
+            life_map = cycle(grid=life_map, survive_min=self.survive_min, survive_max=self.survive_max,
+                             resurrect_min=self.resurrect_min, resurrect_max=self.resurrect_max)
+        
+        # the chunk, framed by a ring of wall so the cavern functions never touch the neighbors' tiles
+        grid = LifeMap(map_width=size + 2, map_height=size + 2)
+        grid.alive[1:-1, 1:-1] = life_map.alive[halo:halo + size, halo:halo + size]
+        
+        # fill small caverns, unless they touch the chunk edge (they may carry on into the neighbor)
+        labels, sizes, coordinates = label_caverns(grid)
+        edge_labels = np.unique(np.concatenate((labels[1, :], labels[-2, :], labels[:, 1], labels[:, -2])))
+        small = sizes < self.min_cavern_size
+        small[edge_labels] = False
+        small[0] = False
+        grid.fill(small[labels])
+        
+        # the map's outer wall, and everything past it
+        xs = np.arange(cx * size - 1, cx * size + size + 1)
+        ys = np.arange(cy * size - 1, cy * size + size + 1)
+        if x_low is not None:
+            grid.alive[(xs < x_low) | (xs > x_high), :] = True
+        if y_low is not None:
+            grid.alive[:, (ys < y_low) | (ys > y_high)] = True
+        
+        # open the portal tile on each edge, on the part of it inside the map (edges outside the map get none)
+        for (edge_x, edge_y, column) in ((cx, cy, 1), (cx + 1, cy, size)):
+            # a vertical edge runs between world columns edge_x * size - 1 and edge_x * size
+            if x_low is None or (x_low <= edge_x * size - 1 and edge_x * size <= x_high):
+                portal = self.get_portal(edge_x, edge_y, VERTICAL_PORTAL_SALT, start=cy * size - 1, low=y_low,
+                                         high=y_high)
+                if portal is not None:
+                    grid.alive[column, portal] = False
+        for (edge_x, edge_y, row) in ((cx, cy, 1), (cx, cy + 1, size)):
+            if y_low is None or (y_low <= edge_y * size - 1 and edge_y * size <= y_high):
+                portal = self.get_portal(edge_x, edge_y, HORIZONTAL_PORTAL_SALT, start=cx * size - 1, low=x_low,
+                                         high=x_high)
+                if portal is not None:
+                    grid.alive[portal, row] = False
+        
+        # zone seeds are picked at random, so pick them from the chunk's own seed
+        state = getstate()
+        random_seed(hash_int(self.seed, cx, cy, CHUNK_SALT))
+        try:
+            corridors = connect_caverns_mst(grid=grid)
+            caverns = [list(zip(xs.tolist(), ys.tolist())) for (xs, ys) in label_caverns(grid)[2]]
+            starting_seeds = get_starting_seeds(caverns=caverns, min_cavern_size=self.min_cavern_size,
+                                                zone_seed_min_distance=self.zone_seed_min_distance)
+        finally:
+            setstate(state)
+        zone_grid, zones, zone_sizes, centroids = partition_zones(grid=grid, starting_seeds=starting_seeds)
+        
+        # back to world coordinates
+        dx, dy = cx * size - 1, cy * size - 1
+        zones = [[(x + dx, y + dy) for (x, y) in zone] for zone in zones]
+        corridors = [(x + dx, y + dy) for (x, y) in corridors]
+        return Chunk(cx=cx, cy=cy, size=size, blocked=grid.alive[1:-1, 1:-1].copy(), zones=zones,
+                     zone_grid=zone_grid[1:-1, 1:-1].copy(), corridors=corridors)
+
+
+class ChunkedWorld:
+    def __init__(self, generator, x=0, y=0, width=None, height=None):
+        """
+        Lazily generated world: chunks are only built when asked for, and kept once built
+        :param generator: ChunkGenerator object
+        :param x: left edge of the area chunks may be generated in
+        :param y: top edge of the area chunks may be generated in
+        :param width: width of that area, or None for no limit
+        :param height: height of that area, or None for no limit
+        """
+        self.generator = generator
+        self.chunk_size = generator.chunk_size
+        self.chunks = {}
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+    
+    def get_chunk_coordinates(self, x, y):
+        return x // self.chunk_size, y // self.chunk_size
+    
+    def in_bounds(self, cx, cy):
+        """
+        :return: boolean True if the chunk overlaps the area chunks may be generated in
+        """
+        size = self.chunk_size
+        if self.width is not None and not (self.x - size < cx * size < self.x + self.width):
+            return False
+        if self.height is not None and not (self.y - size < cy * size < self.y + self.height):
+            return False
+        return True
+    
+    def get_chunk(self, cx, cy, generate=True):
+        """
+        :param cx: chunk x coordinate
+        :param cy: chunk y coordinate
+        :param generate: boolean, generate the chunk if it hasn't been yet
+        :return: Chunk object, or None if it isn't generated (or is out of bounds)
+        """
+        chunk = self.chunks.get((cx, cy))
+        if chunk is None and generate and self.in_bounds(cx, cy):
+            chunk = self.generator.generate(cx, cy, bounds=(self.x, self.y, self.width, self.height))
+            self.chunks[(cx, cy)] = chunk
+        return chunk
+    
+    def load_around(self, x, y, radius):
+        """
+        Generate every chunk within radius tiles of a location (the player, usually)
+        :param x: world x coordinate
+        :param y: world y coordinate
+        :param radius: int distance in tiles
+        :return: list of newly generated Chunk objects
+        """
+        (min_cx, min_cy) = self.get_chunk_coordinates(x - radius, y - radius)
+        (max_cx, max_cy) = self.get_chunk_coordinates(x + radius, y + radius)
+        new_chunks = []
+        for cx in range(min_cx, max_cx + 1):
+            for cy in range(min_cy, max_cy + 1):
+                if (cx, cy) not in self.chunks:
+                    chunk = self.get_chunk(cx, cy)
+                    if chunk:
+                        new_chunks.append(chunk)
+        return new_chunks
+    
+    def get_zone(self, x, y):
+        """
+        :return: (Chunk object, int index into chunk.zones), or None if the location is not in a zone
+        """
+        chunk = self.get_chunk(*self.get_chunk_coordinates(x, y), generate=False)
+        if chunk is None:
+            return None
+        zone_id = chunk.zone_grid[x - chunk.x, y - chunk.y]
+        if zone_id < 0:
+            return None
+        return chunk, int(zone_id)
@@ -1,47 +1,178 @@
 from random import randint, choice
 
+import numpy as np
 import tcod as libtcod
 
 from src.components.ai import BasicMonster
 from src.components.party import PartyMember, Party
 from src.entity import Entity
-from src.map_objects.caverns import create_caverns
-from src.map_objects.tile import Tile
+from src.map_objects.caverns import get_zone_grid
+from src.map_objects.chunks import ChunkedWorld
+from src.map_objects.level_cache import create_level
+from src.map_objects.navigation import NavigationGrid, ChaseMap
+from src.map_objects.tile import TileGrid
 from src.render_functions import RenderOrder
 
 
 class GameMap:
-    def __init__(self, width, height):
+    def __init__(self, width, height, chase_monsters=False):
+        """
+        :param width: int width of map
+        :param height: int height of map
+        :param chase_monsters: boolean, monsters follow the shared chase map instead of each running A*
+        """
         self.width = width
         self.height = height
+        # one boolean array per tile attribute, indexed [x][y] - self.tiles is a Tile-like view over them
+        self.blocked = np.ones((width, height), dtype=bool)
+        self.block_sight = np.ones((width, height), dtype=bool)
+        self.explored = np.zeros((width, height), dtype=bool)
+        self.tile_listeners = []
         self.tiles = self.initialize_tiles()
+        self.navigation = NavigationGrid(self)
+        self.chase_map = ChaseMap(self)
+        self.chase_monsters = chase_monsters
+        self.zones = []
+        self.zone_grid = None
+        self.zone_graph = None
+        self.world = None
+        self.load_radius = 0
     
     def initialize_tiles(self):
-        return [[Tile(True) for y in range(self.height)] for x in range(self.width)]
+        return TileGrid(self.blocked, self.block_sight, self.explored, on_change=self.notify_tile_listeners)
+    
+    def add_tile_listener(self, listener):
+        """
+        Register a function to be told whenever tiles change whether they block movement or sight
+        :param listener: function(x, y, width, height) taking the changed rectangle
+        :return: None
+        """
+        self.tile_listeners.append(listener)
+    
+    def remove_tile_listener(self, listener):
+        if listener in self.tile_listeners:
+            self.tile_listeners.remove(listener)
+    
+    def notify_tile_listeners(self, x, y, width, height):
+        for listener in self.tile_listeners:
+            listener(x, y, width, height)
+    
+    def set_tiles(self, blocked, block_sight=None, x=0, y=0):
+        """
+        Bulk setter: copy a rectangle of tiles into the map, clipped to the map edges
+        :param blocked: 2d boolean array indexed [x][y], True for tiles that block movement
+        :param block_sight: 2d boolean array of the same shape, or None to block sight wherever movement is blocked
+        :param x: map x coordinate of the rectangle's left edge
+        :param y: map y coordinate of the rectangle's top edge
+        :return: None
+        """
+        if block_sight is None:
+            block_sight = blocked
+        (width, height) = blocked.shape
+        x1, y1 = max(x, 0), max(y, 0)
+        x2, y2 = min(x + width, self.width), min(y + height, self.height)
+        if x1 >= x2 or y1 >= y2:
+            return
+        self.blocked[x1:x2, y1:y2] = blocked[x1 - x:x2 - x, y1 - y:y2 - y]
+        self.block_sight[x1:x2, y1:y2] = block_sight[x1 - x:x2 - x, y1 - y:y2 - y]
+        self.notify_tile_listeners(x1, y1, x2 - x1, y2 - y1)
     
     def make_map(self, survive_min, survive_max, resurrect_min, resurrect_max, iterations,
-                 zone_seed_min_distance, min_cavern_size, player, entities, max_monsters_per_room):
-        life_map, zones, corridors = create_caverns(map_width=self.width, map_height=self.height,
-                                                    survive_min=survive_min, survive_max=survive_max,
-                                                    resurrect_min=resurrect_min, resurrect_max=resurrect_max,
-                                                    iterations=iterations,
-                                                    zone_seed_min_distance=zone_seed_min_distance,
-                                                    min_cavern_size=min_cavern_size)
+                 zone_seed_min_distance, min_cavern_size, player, entities, max_monsters_per_room, seed=None,
+                 level_cache=None):
+        if level_cache is not None and seed is not None:
+            life_map, zones, zone_graph = level_cache.get_or_create(seed=seed, map_width=self.width,
+                                                                    map_height=self.height,
+                                                                    survive_min=survive_min, survive_max=survive_max,
+                                                                    resurrect_min=resurrect_min,
+                                                                    resurrect_max=resurrect_max,
+                                                                    iterations=iterations,
+                                                                    zone_seed_min_distance=zone_seed_min_distance,
+                                                                    min_cavern_size=min_cavern_size)
+        else:
+            life_map, zones, zone_graph = create_level(map_width=self.width, map_height=self.height,
+                                                       survive_min=survive_min, survive_max=survive_max,
+                                                       resurrect_min=resurrect_min, resurrect_max=resurrect_max,
+                                                       iterations=iterations,
+                                                       zone_seed_min_distance=zone_seed_min_distance,
+                                                       min_cavern_size=min_cavern_size, seed=seed)
+        self.load_level(life_map=life_map, zones=zones, zone_graph=zone_graph, player=player, entities=entities,
+                        max_monsters_per_room=max_monsters_per_room)
+    
+    def load_level(self, life_map, zones, zone_graph, player, entities, max_monsters_per_room):
+        """
+        Fill the map from an already generated level (see LevelPregenerator), and place the player and monsters
+        :param life_map: LifeMap object
+        :param zones: list of lists of tuple int x y coordinates
+        :param zone_graph: ZoneGraph object for the level (see create_level)
+        :param player: player Entity object
+        :param entities: EntityList of Entity objects to add monsters to
+        :param max_monsters_per_room: int maximum number of monsters per zone
+        :return: None
+        """
         # convert LifeMap to GameMap
-        for x in range(self.width):
-            for y in range(self.height):
-                if not life_map.alive[x][y]:
-                    self.tiles[x][y].blocked = False
-                    self.tiles[x][y].block_sight = False
+        self.set_tiles(blocked=life_map.alive)
+        
+        self.zones = zones
+        self.zone_grid = get_zone_grid(map_width=self.width, map_height=self.height, zones=zones)
+        self.zone_graph = zone_graph
         
         # place the player in the first zone
-        player.x, player.y = choice(zones[0])
+        player.place(*choice(zones[0]))
         
         # place other stuff in other zones
         for zone in zones[1:]:
             self.place_entities(zone=zone, entities=entities, max_monsters_per_room=max_monsters_per_room)
+    
+    def make_chunked_map(self, chunk_generator, player, entities, max_monsters_per_room, load_radius):
+        """
+        Alternative to make_map: caverns are generated chunk by chunk, only as the player gets near them
+        :param chunk_generator: ChunkGenerator object
+        :param player: player Entity object
+        :param entities: EntityList of Entity objects to add monsters to
+        :param max_monsters_per_room: int maximum number of monsters per zone
+        :param load_radius: int distance from the player that chunks are generated within (at least the FOV radius)
+        :return: None
+        """
+        self.world = ChunkedWorld(generator=chunk_generator, width=self.width, height=self.height)
+        self.load_radius = load_radius
         
-        # not currently using corridors for anything interesting :/
+        # place the player in the largest zone of the middle chunk
+        start = self.world.get_chunk(*self.world.get_chunk_coordinates(self.width // 2, self.height // 2))
+        player.place(*choice(max(start.zones, key=len)))
+        
+        for chunk in [start] + self.world.load_around(player.x, player.y, self.load_radius):
+            self.populate_chunk(chunk=chunk, player=player, entities=entities,
+                                max_monsters_per_room=max_monsters_per_room)
+    
+    def update_chunks(self, player, entities, max_monsters_per_room):
+        """
+        Generate (and populate) any chunks the player has come close to
+        :param player: player Entity object
+        :param entities: EntityList of Entity objects to add monsters to
+        :param max_monsters_per_room: int maximum number of monsters per zone
+        :return: list of newly generated Chunk objects
+        """
+        new_chunks = self.world.load_around(player.x, player.y, self.load_radius)
+        for chunk in new_chunks:
+            self.populate_chunk(chunk=chunk, player=player, entities=entities,
+                                max_monsters_per_room=max_monsters_per_room)
+        return new_chunks
+    
+    def populate_chunk(self, chunk, player, entities, max_monsters_per_room):
+        """
+        Copy a chunk's tiles into the map, add its zones to the map's zones, and place stuff in every zone except
+        the player's
+        :return: None
+        """
+        # chunks are generated with the map's outer wall built in (see ChunkGenerator.generate), so every zone tile
+        # is on the map
+        self.set_tiles(blocked=chunk.blocked, x=chunk.x, y=chunk.y)
+        chunk.zone_offset = len(self.zones)
+        self.zones.extend(chunk.zones)
+        for zone in chunk.zones:
+            if (player.x, player.y) not in zone:
+                self.place_entities(zone=zone, entities=entities, max_monsters_per_room=max_monsters_per_room)
     
     def place_entities(self, zone, entities, max_monsters_per_room):
         # Get a random number of monsters
@@ -50,7 +181,7 @@ class GameMap:
             # Choose a random location in the room
             (x, y) = choice(zone)
             
-            if not any([entity for entity in entities if entity.x == x and entity.y == y]):
+            if not entities.get_at(x, y):
                 value = randint(0, 100)
                 if value <= 90:
                     party_component = Party(coins=randint(1, 5))
@@ -65,7 +196,7 @@ class GameMap:
                     #     member_3 = PartyMember(name="Slinger", profession="Kobold", offensive_cd=5, defensive_cd=5,
                     #                            attack_type={'ranged': 3}, cost=0)
                     #     party_component.add_member(member_3)
-                    ai_component = BasicMonster()
+                    ai_component = BasicMonster(chase=self.chase_monsters)
                     monster = Entity(x=x, y=y, char='k', color=libtcod.light_green, name='Kobold Pack',
                                      blocks=True, render_order=RenderOrder.ACTOR, party=party_component,
                                      ai=ai_component)
@@ -79,13 +210,32 @@ class GameMap:
                 
                 entities.append(monster)
     
+    def get_zone(self, x, y):
+        """
+        Looks up which zone a location is in
+        :param x: x location on map
+        :param y: y location on map
+        :return: int index into self.zones, or None if the location is not in a zone
+        """
+        if self.world:
+            chunk_zone = self.world.get_zone(x, y)
+            if chunk_zone is None:
+                return None
+            chunk, zone_id = chunk_zone
+            return chunk.zone_offset + zone_id
+        
+        zone_id = self.zone_grid[x, y]
+        if zone_id < 0:
+            return None
+        return int(zone_id)
+    
     def is_blocked(self, x, y):
         """
         Tests whether a location blocks movement
         :param x: x location on map
         :param y: y location on map
-        :return: boolean True if blocked, else False
+        :return: boolean True if blocked (or off the map), else False
         """
-        if self.tiles[x][y].blocked:
+        if not (0 <= x < self.width and 0 <= y < self.height):
             return True
-        return False
+        return bool(self.blocked[x, y])
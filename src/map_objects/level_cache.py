@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from src.map_objects.caverns import LifeMap, create_caverns, get_zone_grid
+from src.map_objects.zone_graph import ZoneGraph
+
+# bump whenever create_level would make a different level from the same inputs (or the file layout changes), so
+# stale levels are never loaded
+CACHE_VERSION = 2
+
+
+def create_level(seed, **params):
+    """
+    Generate a level: the caverns, plus the zone graph long paths are planned over
+    :param seed: int random seed to generate the level from
+    :param params: create_caverns keyword arguments
+    :return: LifeMap object, list of lists of tuple int x y zones, ZoneGraph object
+    """
+    life_map, zones, corridors = create_caverns(seed=seed, **params)
+    zone_grid = get_zone_grid(map_width=life_map.width, map_height=life_map.height, zones=zones)
+    return life_map, zones, ZoneGraph.from_map(blocked=life_map.alive, zone_grid=zone_grid)
+
+
+class LevelCache:
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024):
+        """
+        Content-addressed on-disk cache of generated levels, with least recently used eviction
+        Each level is one .npz file named after a hash of every create_caverns input plus the seed
+        :param directory: str path of the folder to keep cached levels in (created if missing)
+        :param max_bytes: int total size the cached files may take up before the oldest are removed
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+    
+    @staticmethod
+    def get_key(seed, **params):
+        """
+        Hash of everything that determines a level
+        :param seed: int random seed the level is generated from
+        :param params: create_caverns keyword arguments
+        :return: str hex digest
+        """
+        description = json.dumps({'version': CACHE_VERSION, 'seed': seed, 'params': params}, sort_keys=True)
+        return hashlib.sha256(description.encode('utf-8')).hexdigest()
+    
+    def get_path(self, key):
+        return os.path.join(self.directory, '{}.npz'.format(key))
+    
+    def get_or_create(self, seed, map_width, map_height, survive_min, survive_max, resurrect_min, resurrect_max,
+                      iterations, zone_seed_min_distance, min_cavern_size):
+        """
+        Returns the cached level for these inputs, generating and storing it first on a cache miss
+        :param seed: int random seed to generate the level from
+        :return: LifeMap object, list of lists of tuple int x y zones, ZoneGraph object
+        """
+        params = dict(map_width=map_width, map_height=map_height, survive_min=survive_min, survive_max=survive_max,
+                      resurrect_min=resurrect_min, resurrect_max=resurrect_max, iterations=iterations,
+                      zone_seed_min_distance=zone_seed_min_distance, min_cavern_size=min_cavern_size)
+        key = self.get_key(seed, **params)
+        
+        level = self.load(key)
+        if level is None:
+            level = create_level(seed=seed, **params)
+            self.save(key, *level)
+        return level
+    
+    def load(self, key):
+        """
+        Fast path: read a level straight from disk, skipping generation
+        :param key: str cache key from get_key
+        :return: LifeMap object, list of zones, ZoneGraph object - or None on a cache miss
+        """
+        path = self.get_path(key)
+        try:
+            with np.load(path) as data:
+                width, height = data['shape'].tolist()
+                alive = np.unpackbits(data['alive'], count=width * height).astype(bool).reshape(width, height)
+                zone_tiles = [tuple(tile) for tile in data['zone_tiles'].tolist()]
+                zone_ends = np.cumsum(data['zone_sizes']).tolist()
+                zone_graph = ZoneGraph.from_arrays(regions=data['regions'], nodes=data['nodes'], edges=data['edges'])
+        except (OSError, KeyError, ValueError):
+            return None
+        
+        # mark as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        
+        zones = []
+        start = 0
+        for end in zone_ends:
+            zones.append(zone_tiles[start:end])
+            start = end
+        return LifeMap.from_array(alive), zones, zone_graph
+    
+    def save(self, key, life_map, zones, zone_graph):
+        """
+        Write a level to disk as packed bits plus coordinate arrays, then evict old levels if over budget
+        :param key: str cache key from get_key
+        :param life_map: LifeMap object
+        :param zones: list of lists of tuple int x y coordinates
+        :param zone_graph: ZoneGraph object
+        :return: None
+        """
+        zone_tiles = [tile for zone in zones for tile in zone]
+        regions, nodes, edges = zone_graph.get_arrays()
+        handle, temp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        with os.fdopen(handle, 'wb') as temp_file:
+            np.savez_compressed(temp_file,
+                                shape=np.array([life_map.width, life_map.height], dtype=np.int32),
+                                alive=np.packbits(life_map.alive),
+                                zone_tiles=np.array(zone_tiles, dtype=np.int32).reshape(-1, 2),
+                                zone_sizes=np.array([len(zone) for zone in zones], dtype=np.int32),
+                                regions=regions, nodes=nodes, edges=edges)
+        # rename into place so a half written file is never loaded
+        os.replace(temp_path, self.get_path(key))
+        self.evict(keep=key)
+    
+    def evict(self, keep=None):
+        """
+        Remove the least recently used levels until the cache fits in max_bytes
+        :param keep: str cache key of a level never to remove (the one just saved, even if it is over max_bytes alone)
+        :return: None
+        """
+        keep_path = self.get_path(keep) if keep is not None else None
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz'):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        
+        total = sum(size for (mtime, size, path) in entries)
+        for (mtime, size, path) in sorted(entries):
+            if path == keep_path:
+                continue
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
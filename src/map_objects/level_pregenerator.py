@@ -0,0 +1,74 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from random import getrandbits
+
+from src.map_objects.level_cache import LevelCache, create_level
+
+
+def generate_level(seed, level_params, cache_directory=None):
+    """
+    Worker process entry point: build one level
+    :param seed: int random seed for the level
+    :param level_params: dict of create_caverns keyword arguments
+    :param cache_directory: str path of a LevelCache folder to read from / write to, or None to skip caching
+    :return: LifeMap object, list of zones, ZoneGraph object
+    """
+    if cache_directory is not None:
+        return LevelCache(directory=cache_directory).get_or_create(seed=seed, **level_params)
+    return create_level(seed=seed, **level_params)
+
+
+class LevelPregenerator:
+    def __init__(self, level_params, levels_ahead=2, max_workers=None, first_seed=None, cache_directory=None):
+        """
+        Keeps the next few levels generating in worker processes, so the main loop never waits on create_level
+        :param level_params: dict of create_caverns keyword arguments (map size, life rules, zone variables)
+        :param levels_ahead: int number of levels to keep ready or in progress
+        :param max_workers: int number of worker processes (defaults to levels_ahead)
+        :param first_seed: int seed for the first level, or None for a random one
+        :param cache_directory: str path of a LevelCache folder the workers share, or None to skip caching
+        """
+        self.level_params = level_params
+        self.levels_ahead = levels_ahead
+        self.cache_directory = cache_directory
+        self.executor = ProcessPoolExecutor(max_workers=max_workers or levels_ahead)
+        self.pending = deque()
+        self.next_seed = first_seed
+        self.fill()
+    
+    def fill(self):
+        """
+        Start generating levels until levels_ahead levels are ready or in progress
+        :return: None
+        """
+        while len(self.pending) < self.levels_ahead:
+            seed = self.next_seed if self.next_seed is not None else getrandbits(32)
+            self.next_seed = None
+            future = self.executor.submit(generate_level, seed, self.level_params, self.cache_directory)
+            self.pending.append((seed, future))
+    
+    def poll(self):
+        """
+        Non-blocking: hand out the next level if it has finished generating
+        :return: (LifeMap object, list of zones, ZoneGraph object) bundle, or None if the next level isn't ready
+        """
+        if not self.pending or not self.pending[0][1].done():
+            return None
+        return self.get_level()
+    
+    def get_level(self):
+        """
+        Blocking: hand out the next level, waiting for it to finish generating if needed
+        :return: (LifeMap object, list of zones, ZoneGraph object) bundle
+        """
+        seed, future = self.pending.popleft()
+        self.fill()
+        return future.result()
+    
+    def shutdown(self):
+        """
+        Stop the worker processes, dropping any levels that haven't started yet
+        :return: None
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.pending.clear()
@@ -0,0 +1,302 @@
+import numpy as np
+import tcod as libtcod
+
+
+def get_step_distances(walkable, x, y, max_distance=None):
+    """
+    Breadth first search out from one tile, one whole layer of tiles at a time (orthogonal steps only)
+    :param walkable: 2d boolean array indexed [x][y]
+    :param x: x index of the starting tile
+    :param y: y index of the starting tile
+    :param max_distance: int number of steps to search, or None to search everything reachable
+    :return: 2d int array of steps from the start (-1 for tiles not reached)
+    """
+    distances = np.full(walkable.shape, -1, dtype=np.int32)
+    frontier = np.zeros(walkable.shape, dtype=bool)
+    frontier[x, y] = True
+    reached = frontier.copy()
+    distances[frontier] = 0
+    distance = 0
+    while max_distance is None or distance < max_distance:
+        distance += 1
+        grown = np.zeros_like(frontier)
+        grown[1:, :] |= frontier[:-1, :]
+        grown[:-1, :] |= frontier[1:, :]
+        grown[:, 1:] |= frontier[:, :-1]
+        grown[:, :-1] |= frontier[:, 1:]
+        frontier = grown & walkable & ~reached
+        if not frontier.any():
+            break
+        distances[frontier] = distance
+        reached |= frontier
+    return distances
+
+
+class NavigationGrid:
+    def __init__(self, game_map):
+        """
+        Pathfinding map shared by every monster on a level, instead of each monster's A* building its own
+         - static walkability comes from the game map's blocked array, and is kept in sync through a tile listener
+         - an occupancy overlay counts the blocking entities on each tile, and is updated by the EntityList as they
+           move
+        :param game_map: GameMap object
+        """
+        self.game_map = game_map
+        self.width = game_map.width
+        self.height = game_map.height
+        self.nav_map = libtcod.map_new(game_map.width, game_map.height)
+        self.occupancy = np.zeros((game_map.width, game_map.height), dtype=np.int16)
+        # bumped on every tile change, with the version each tile last changed at, so cached paths can tell
+        # whether anything under them has changed
+        self.version = 0
+        self.changed_at = np.zeros((game_map.width, game_map.height), dtype=np.int64)
+        self.path_hits = 0
+        self.path_misses = 0
+        self.update_region(0, 0, game_map.width, game_map.height)
+        # one path object, reused for every search (0.0 - no diagonal moves)
+        self.path = libtcod.path_new_using_map(self.nav_map, 0.0)
+        game_map.add_tile_listener(self.update_region)
+    
+    def update_region(self, x, y, width, height):
+        """
+        Tile listener: rebuild the walkable flags for a rectangle of the map (nav map arrays are indexed [y][x])
+        :return: None
+        """
+        x1, y1 = max(0, x), max(0, y)
+        x2, y2 = min(self.width, x + width), min(self.height, y + height)
+        if x1 >= x2 or y1 >= y2:
+            return
+        open_tiles = ~self.game_map.blocked[x1:x2, y1:y2] & (self.occupancy[x1:x2, y1:y2] == 0)
+        self.nav_map.walkable[y1:y2, x1:x2] = open_tiles.T
+        self.version += 1
+        self.changed_at[x1:x2, y1:y2] = self.version
+    
+    def update_tile(self, x, y):
+        self.nav_map.walkable[y, x] = not self.game_map.blocked[x, y] and self.occupancy[x, y] == 0
+    
+    def set_blockers(self, entities):
+        """
+        Rebuild the occupancy overlay from scratch, costing one step per entity (EntityList.set_navigation does this
+        once, then keeps the overlay up to date as entities move, die or are removed)
+        :param entities: list of Entity objects
+        :return: None
+        """
+        occupied = np.nonzero(self.occupancy)
+        self.occupancy[occupied] = 0
+        self.nav_map.walkable[occupied[1], occupied[0]] = ~self.game_map.blocked[occupied]
+        for entity in entities:
+            if entity.blocks:
+                self.add_blocker(entity.x, entity.y)
+    
+    def add_blocker(self, x, y):
+        self.occupancy[x, y] += 1
+        self.nav_map.walkable[y, x] = False
+    
+    def remove_blocker(self, x, y):
+        if self.occupancy[x, y] > 0:
+            self.occupancy[x, y] -= 1
+        self.update_tile(x, y)
+    
+    def compute_path(self, x, y, target_x, target_y):
+        """
+        A* over the shared map, with the start and end tiles opened up for the search (they are normally taken by
+        the entity moving and its target)
+        :param x: start x location
+        :param y: start y location
+        :param target_x: destination x location
+        :param target_y: destination y location
+        :return: list of tuple int x y steps, not including the start, or an empty list if there is no path
+        """
+        ends = [(x, y), (target_x, target_y)]
+        saved = [bool(self.nav_map.walkable[end_y, end_x]) for (end_x, end_y) in ends]
+        for (end_x, end_y) in ends:
+            self.nav_map.walkable[end_y, end_x] = not self.game_map.blocked[end_x, end_y]
+        try:
+            libtcod.path_compute(self.path, x, y, target_x, target_y)
+        finally:
+            for (end_x, end_y), walkable in zip(ends, saved):
+                self.nav_map.walkable[end_y, end_x] = walkable
+        
+        return [libtcod.path_get(self.path, index) for index in range(libtcod.path_size(self.path))]
+    
+    def get_path(self, cached, x, y, target_x, target_y):
+        """
+        Reuse a monster's path from earlier turns where possible, only searching again when
+         - the monster is neither where the path starts nor on its first step, or the path has run out
+         - the target has moved, other than one step on from (or back along) the path's end
+         - the next step is taken by a blocking entity
+         - a tile under the path has changed since it was computed
+        :param cached: CachedPath object from the last call, or None
+        :param x: x location of the monster
+        :param y: y location of the monster
+        :param target_x: x location of the target
+        :param target_y: y location of the target
+        :return: CachedPath object
+        """
+        if cached is not None and self.is_path_valid(cached, x, y, target_x, target_y):
+            self.path_hits += 1
+            return cached
+        self.path_misses += 1
+        return CachedPath(steps=self.compute_path(x, y, target_x, target_y), start=(x, y), version=self.version)
+    
+    def is_path_valid(self, cached, x, y, target_x, target_y):
+        steps = cached.steps
+        if steps and cached.start != (x, y) and steps[0] == (x, y):
+            # the monster took its first step (resolve_intents moves monsters, the path isn't advanced for it)
+            cached.advance()
+        if not steps or cached.start != (x, y):
+            return False
+        
+        if steps[-1] != (target_x, target_y):
+            # follow a target that has stepped off the end of the path, a few times before searching again
+            if len(steps) > 1 and steps[-2] == (target_x, target_y):
+                steps.pop()
+            elif cached.repairs < cached.max_repairs and not self.game_map.blocked[target_x, target_y] and \
+                    abs(steps[-1][0] - target_x) + abs(steps[-1][1] - target_y) == 1:
+                steps.append((target_x, target_y))
+                cached.repairs += 1
+            else:
+                return False
+        
+        (next_x, next_y) = steps[0]
+        if self.occupancy[next_x, next_y] and steps[0] != (target_x, target_y):
+            return False
+        xs, ys = zip(*steps)
+        return self.changed_at[xs, ys].max() <= cached.version
+
+
+class CachedPath:
+    def __init__(self, steps, start, version, max_repairs=4):
+        """
+        A monster's path, kept between turns (see NavigationGrid.get_path)
+        :param steps: list of tuple int x y steps, not including the start
+        :param start: tuple int x y location the path starts from
+        :param version: NavigationGrid version when the path was computed
+        :param max_repairs: int number of times the path may be stretched to follow a moving target
+        """
+        self.steps = steps
+        self.start = start
+        self.version = version
+        self.repairs = 0
+        self.max_repairs = max_repairs
+    
+    def advance(self):
+        """
+        Take the first step of the path
+        :return: tuple int x y location stepped to
+        """
+        self.start = self.steps.pop(0)
+        return self.start
+
+
+class ChaseMap:
+    def __init__(self, game_map, max_distance=25):
+        """
+        Distance field out from one target (the player), shared by every monster chasing it
+        It only covers the square within max_distance of the target, and is only rebuilt when the target moves or
+        the map changes, so each monster's step is a look at its four neighbors
+        :param game_map: GameMap object
+        :param max_distance: int number of steps the field reaches (monsters further away don't chase)
+        """
+        self.game_map = game_map
+        self.max_distance = max_distance
+        self.target = None
+        self.x = 0
+        self.y = 0
+        self.distances = None
+        game_map.add_tile_listener(self.invalidate)
+    
+    def invalidate(self, x, y, width, height):
+        self.target = None
+    
+    def update(self, target_x, target_y):
+        """
+        Rebuild the field around the target, unless it is already centred there
+        :return: None
+        """
+        if self.target == (target_x, target_y):
+            return
+        self.target = (target_x, target_y)
+        
+        self.x, self.y = max(0, target_x - self.max_distance), max(0, target_y - self.max_distance)
+        x2 = min(self.game_map.width, target_x + self.max_distance + 1)
+        y2 = min(self.game_map.height, target_y + self.max_distance + 1)
+        walkable = ~self.game_map.blocked[self.x:x2, self.y:y2]
+        
+        self.distances = get_step_distances(walkable=walkable, x=target_x - self.x, y=target_y - self.y,
+                                            max_distance=self.max_distance)
+    
+    def get_distance(self, x, y):
+        """
+        :return: int number of steps to the target, or None if it is further than max_distance (or unreachable)
+        """
+        if self.distances is None:
+            return None
+        (width, height) = self.distances.shape
+        if not (0 <= x - self.x < width and 0 <= y - self.y < height):
+            return None
+        distance = self.distances[x - self.x, y - self.y]
+        if distance < 0:
+            return None
+        return int(distance)
+    
+    def get_step(self, x, y, occupancy):
+        """
+        Best next step towards the target: the closest neighbor that isn't taken by a blocking entity
+        :param x: x location of the monster
+        :param y: y location of the monster
+        :param occupancy: 2d int array of blocking entities per tile (see NavigationGrid)
+        :return: tuple int x y, or None if the monster is out of range or every step towards the target is taken
+        """
+        distance = self.get_distance(x, y)
+        if distance is None:
+            return None
+        best = None
+        for (dx, dy) in ((0, -1), (1, 0), (0, 1), (-1, 0)):
+            step_distance = self.get_distance(x + dx, y + dy)
+            if step_distance is not None and step_distance < distance and not occupancy[x + dx, y + dy]:
+                best = (x + dx, y + dy)
+                distance = step_distance
+        return best
+    
+    def get_distances(self, xs, ys):
+        """
+        Batched get_distance
+        :param xs: int array of x locations
+        :param ys: int array of y locations
+        :return: int array of steps to the target (-1 where get_distance would return None)
+        """
+        distances = np.full(xs.shape, -1, dtype=np.int32)
+        if self.distances is None:
+            return distances
+        (width, height) = self.distances.shape
+        xs, ys = xs - self.x, ys - self.y
+        inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+        distances[inside] = self.distances[xs[inside], ys[inside]]
+        return distances
+    
+    def get_steps(self, xs, ys, occupancy):
+        """
+        Batched get_step, for every monster chasing the target at once
+        :param xs: int array of monster x locations
+        :param ys: int array of monster y locations
+        :param occupancy: 2d int array of blocking entities per tile (see NavigationGrid)
+        :return: int arrays of step x and y locations, and a boolean array (False where get_step would return None)
+        """
+        best = self.get_distances(xs, ys)
+        in_range = best >= 0
+        step_xs, step_ys = xs.copy(), ys.copy()
+        found = np.zeros(xs.shape, dtype=bool)
+        (width, height) = occupancy.shape
+        for (dx, dy) in ((0, -1), (1, 0), (0, 1), (-1, 0)):
+            next_xs, next_ys = xs + dx, ys + dy
+            step_distances = self.get_distances(next_xs, next_ys)
+            free = np.zeros(xs.shape, dtype=bool)
+            on_map = (next_xs >= 0) & (next_xs < width) & (next_ys >= 0) & (next_ys < height)
+            free[on_map] = occupancy[next_xs[on_map], next_ys[on_map]] == 0
+            better = in_range & (step_distances >= 0) & (step_distances < best) & free
+            best[better] = step_distances[better]
+            step_xs[better] = next_xs[better]
+            step_ys[better] = next_ys[better]
+            found |= better
+        return step_xs, step_ys, found
@@ -12,3 +12,80 @@ class Tile:
             block_sight = blocked
         
         self.block_sight = block_sight
+
+
+class TileView:
+    """
+    A Tile-like view of one cell of a map stored as separate blocked / block_sight / explored arrays.
+    Reading or setting an attribute reads or writes the arrays, so existing tile.blocked code keeps working.
+    """
+    
+    def __init__(self, blocked, block_sight, explored, x, y, on_change=None):
+        self._blocked = blocked
+        self._block_sight = block_sight
+        self._explored = explored
+        self._x = x
+        self._y = y
+        self._on_change = on_change
+    
+    def _changed(self):
+        if self._on_change:
+            self._on_change(self._x, self._y, 1, 1)
+    
+    @property
+    def blocked(self):
+        return bool(self._blocked[self._x, self._y])
+    
+    @blocked.setter
+    def blocked(self, value):
+        self._blocked[self._x, self._y] = value
+        self._changed()
+    
+    @property
+    def block_sight(self):
+        return bool(self._block_sight[self._x, self._y])
+    
+    @block_sight.setter
+    def block_sight(self, value):
+        self._block_sight[self._x, self._y] = value
+        self._changed()
+    
+    @property
+    def explored(self):
+        return bool(self._explored[self._x, self._y])
+    
+    @explored.setter
+    def explored(self, value):
+        self._explored[self._x, self._y] = value
+
+
+class TileGrid:
+    """
+    tiles[x][y] access to a map stored as blocked / block_sight / explored arrays, returning TileView objects
+    on_change(x, y, width, height) is called whenever a view changes blocked or block_sight
+    """
+    
+    def __init__(self, blocked, block_sight, explored, on_change=None):
+        self.blocked = blocked
+        self.block_sight = block_sight
+        self.explored = explored
+        self.on_change = on_change
+    
+    def __getitem__(self, x):
+        return TileColumn(self, x)
+    
+    def __len__(self):
+        return len(self.blocked)
+
+
+class TileColumn:
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.x = x
+    
+    def __getitem__(self, y):
+        return TileView(self.grid.blocked, self.grid.block_sight, self.grid.explored, self.x, y,
+                        on_change=self.grid.on_change)
+    
+    def __len__(self):
+        return self.grid.blocked.shape[1]
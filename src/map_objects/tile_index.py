@@ -0,0 +1,176 @@
+from random import choice
+
+import numpy as np
+
+
+class TileIndex:
+    def __init__(self, tiles=(), bucket_size=8):
+        """
+        Grid-bucket spatial index over tile coordinates, for orthogonal (Manhattan) distance queries
+        Tiles are hashed into square buckets, so a query only looks at the buckets that could hold an answer
+        :param tiles: iterable of tuple int x y coordinates to index
+        :param bucket_size: int width and height of a bucket, about the radius of the most common query
+        """
+        self.bucket_size = max(1, bucket_size)
+        self.buckets = {}
+        self.tiles = []
+        self.positions = {}
+        self.min_bucket = None
+        self.max_bucket = None
+        for tile in tiles:
+            self.add(tile)
+    
+    def __len__(self):
+        return len(self.tiles)
+    
+    def __contains__(self, tile):
+        return tile in self.positions
+    
+    def __iter__(self):
+        return iter(self.tiles)
+    
+    def get_bucket(self, tile):
+        """
+        :param tile: tuple int x y coordinates
+        :return: tuple int x y coordinates of the bucket holding that tile
+        """
+        (x, y) = tile
+        return x // self.bucket_size, y // self.bucket_size
+    
+    def add(self, tile):
+        """
+        Add a tile to the index (tiles already in the index are ignored)
+        :param tile: tuple int x y coordinates
+        :return: None
+        """
+        tile = tuple(tile)
+        if tile in self.positions:
+            return
+        self.positions[tile] = len(self.tiles)
+        self.tiles.append(tile)
+        bucket = self.get_bucket(tile)
+        self.buckets.setdefault(bucket, set()).add(tile)
+        if self.min_bucket is None:
+            self.min_bucket = self.max_bucket = bucket
+        else:
+            self.min_bucket = (min(self.min_bucket[0], bucket[0]), min(self.min_bucket[1], bucket[1]))
+            self.max_bucket = (max(self.max_bucket[0], bucket[0]), max(self.max_bucket[1], bucket[1]))
+    
+    def remove(self, tile):
+        """
+        Remove a tile from the index in O(1) (the last tile is swapped into its place)
+        :param tile: tuple int x y coordinates
+        :return: None
+        """
+        index = self.positions.pop(tile)
+        last = self.tiles.pop()
+        if last != tile:
+            self.tiles[index] = last
+            self.positions[last] = index
+        bucket = self.get_bucket(tile)
+        self.buckets[bucket].discard(tile)
+        if not self.buckets[bucket]:
+            del self.buckets[bucket]
+    
+    def random_choice(self):
+        """
+        :return: tuple int x y coordinates of a random tile in the index
+        """
+        return choice(self.tiles)
+    
+    def remove_within(self, tile, distance):
+        """
+        Removes every tile with an orthogonal distance smaller than the given distance
+        :param tile: tuple int x y coordinates of the center of the removal
+        :param distance: int distance tiles must be from the center to be kept
+        :return: list of tuple int x y removed tiles
+        """
+        (x, y) = tile
+        reach = max(0, distance - 1)
+        (min_bx, min_by) = self.get_bucket((x - reach, y - reach))
+        (max_bx, max_by) = self.get_bucket((x + reach, y + reach))
+        removed = []
+        for bx in range(min_bx, max_bx + 1):
+            for by in range(min_by, max_by + 1):
+                for (x2, y2) in list(self.buckets.get((bx, by), ())):
+                    if abs(x - x2) + abs(y - y2) < distance:
+                        self.remove((x2, y2))
+                        removed.append((x2, y2))
+        return removed
+    
+    def nearest(self, tile):
+        """
+        Finds the indexed tile with the smallest orthogonal distance, searching rings of buckets outwards
+        :param tile: tuple int x y coordinates
+        :return: tuple int x y coordinates of the nearest tile, or None if the index is empty
+        """
+        if not self.tiles:
+            return None
+        (x, y) = tile
+        (cx, cy) = self.get_bucket(tile)
+        max_ring = max(abs(cx - self.min_bucket[0]), abs(cx - self.max_bucket[0]),
+                       abs(cy - self.min_bucket[1]), abs(cy - self.max_bucket[1]))
+        nearest = None
+        shortest_dist = None
+        for ring in range(max_ring + 1):
+            # every tile in this ring (or further) is at least this far away
+            if shortest_dist is not None and shortest_dist <= (ring - 1) * self.bucket_size:
+                break
+            for bucket in get_bucket_ring(cx, cy, ring):
+                for (x2, y2) in self.buckets.get(bucket, ()):
+                    distance = abs(x - x2) + abs(y - y2)
+                    if shortest_dist is None or distance < shortest_dist:
+                        shortest_dist = distance
+                        nearest = (x2, y2)
+        return nearest
+    
+    def farthest_from_all(self, points):
+        """
+        Finds the indexed tile with the largest sum of orthogonal distances to a set of points
+        The x and y parts of the sum are separable, so each is a prefix-sum lookup into the sorted point coordinates
+        :param points: list of tuple int x y coordinates
+        :return: tuple int x y coordinates of the farthest tile, or (None, None) if no tile is any distance away
+        """
+        if not self.tiles or not points:
+            return None, None
+        tiles = np.array(self.tiles, dtype=np.int64)
+        points = np.array(points, dtype=np.int64)
+        total = sum_of_distances(tiles[:, 0], points[:, 0]) + sum_of_distances(tiles[:, 1], points[:, 1])
+        farthest = int(np.argmax(total))
+        if total[farthest] <= 0:
+            return None, None
+        return self.tiles[farthest]
+
+
+def get_bucket_ring(cx, cy, ring):
+    """
+    Lists the buckets on the square ring a given number of buckets away from a center bucket
+    :param cx: center bucket x
+    :param cy: center bucket y
+    :param ring: int ring number (0 is the center bucket itself)
+    :return: list of tuple int x y bucket coordinates
+    """
+    if ring == 0:
+        return [(cx, cy)]
+    buckets = []
+    for offset in range(-ring, ring + 1):
+        buckets.append((cx + offset, cy - ring))
+        buckets.append((cx + offset, cy + ring))
+    for offset in range(-ring + 1, ring):
+        buckets.append((cx - ring, cy + offset))
+        buckets.append((cx + ring, cy + offset))
+    return buckets
+
+
+def sum_of_distances(values, points):
+    """
+    For every value, the sum of absolute differences to all points (one axis of a Manhattan distance)
+    :param values: 1d int array
+    :param points: 1d int array
+    :return: 1d int array of sums, one per value
+    """
+    points = np.sort(points)
+    prefix = np.concatenate(([0], np.cumsum(points)))
+    below = np.searchsorted(points, values, side='right')
+    above = len(points) - below
+    return values * below - prefix[below] + (prefix[-1] - prefix[below]) - values * above
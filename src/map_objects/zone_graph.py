@@ -0,0 +1,230 @@
+import heapq
+
+import numpy as np
+
+from src.map_objects.caverns import LifeMap, label_caverns
+
+
+class ZoneGraph:
+    def __init__(self, regions):
+        """
+        Abstract graph of a level for long range pathfinding
+         - regions are the zones, plus one region for each connected piece of floor outside every zone (the
+           corridors, which are carved after the zones are made)
+         - every pair of touching regions gets one portal: a tile on each side of their border
+         - portal tiles in the same region are linked by their walking distance inside the region
+        Routes are planned over the portals, then each leg is walked with the normal local pathfinding
+        Build one with from_map (or from_arrays, for one saved with get_arrays)
+        :param regions: 2d int array of region ids (-1 for walls)
+        """
+        self.regions = regions
+        self.region_count = int(self.regions.max()) + 1
+        
+        self.nodes = []
+        self.node_ids = {}
+        self.node_regions = []
+        self.edges = []
+        self.region_nodes = [[] for region in range(self.region_count)]
+    
+    @classmethod
+    def from_map(cls, blocked, zone_grid):
+        """
+        :param blocked: 2d boolean array indexed [x][y], True for walls
+        :param zone_grid: 2d int array of zone ids (-1 for tiles in no zone)
+        :return: new ZoneGraph object
+        """
+        graph = cls(regions=cls.get_regions(blocked=blocked, zone_grid=zone_grid))
+        for (tile_a, tile_b) in graph.get_portals():
+            node_a = graph.add_node(tile_a)
+            node_b = graph.add_node(tile_b)
+            graph.add_edge(node_a, node_b, 1)
+        graph.link_regions()
+        return graph
+    
+    @classmethod
+    def from_arrays(cls, regions, nodes, edges):
+        """
+        :param regions: 2d int array of region ids (-1 for walls)
+        :param nodes: int array of node x, y rows, in node id order
+        :param edges: int array of node a, node b, cost rows
+        :return: new ZoneGraph object
+        """
+        graph = cls(regions=regions)
+        for (x, y) in nodes.tolist():
+            graph.add_node((x, y))
+        for (node_a, node_b, cost) in edges.tolist():
+            graph.add_edge(node_a, node_b, cost)
+        return graph
+    
+    def get_arrays(self):
+        """
+        :return: regions, nodes and edges arrays for from_arrays (each edge once)
+        """
+        edges = [(node_a, node_b, cost) for node_a, neighbors in enumerate(self.edges)
+                 for node_b, cost in neighbors.items() if node_a < node_b]
+        return (self.regions, np.array(self.nodes, dtype=np.int32).reshape(-1, 2),
+                np.array(edges, dtype=np.int32).reshape(-1, 3))
+    
+    @staticmethod
+    def get_regions(blocked, zone_grid):
+        """
+        :return: 2d int array of region ids (-1 for walls)
+        """
+        regions = zone_grid.astype(np.int32)
+        outside = ~blocked & (regions < 0)
+        if outside.any():
+            labels = label_caverns(LifeMap.from_array(~outside))[0]
+            regions[outside] = int(zone_grid.max()) + labels[outside]
+        return regions
+    
+    def get_portals(self):
+        """
+        One pair of touching tiles for every pair of touching regions, from the middle of their shared border
+        :return: list of (tuple int x y, tuple int x y) tile pairs
+        """
+        regions = self.regions
+        xs, ys = np.meshgrid(np.arange(regions.shape[0]), np.arange(regions.shape[1]), indexing='ij')
+        pairs = []
+        for (a, b) in (((slice(None, -1), slice(None)), (slice(1, None), slice(None))),
+                       ((slice(None), slice(None, -1)), (slice(None), slice(1, None)))):
+            border = (regions[a] >= 0) & (regions[b] >= 0) & (regions[a] != regions[b])
+            pairs.append(np.stack((regions[a][border], regions[b][border], xs[a][border], ys[a][border],
+                                   xs[b][border], ys[b][border]), axis=1))
+        pairs = np.concatenate(pairs)
+        if not len(pairs):
+            return []
+        
+        # put the lower region first, so both directions of a border group together
+        swap = pairs[:, 0] > pairs[:, 1]
+        pairs[swap] = pairs[swap][:, [1, 0, 4, 5, 2, 3]]
+        pairs = pairs[np.lexsort((pairs[:, 3], pairs[:, 2], pairs[:, 1], pairs[:, 0]))]
+        keys = pairs[:, 0].astype(np.int64) * self.region_count + pairs[:, 1]
+        unique_keys, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+        middles = pairs[starts + counts // 2]
+        return [((int(x1), int(y1)), (int(x2), int(y2))) for (ra, rb, x1, y1, x2, y2) in middles.tolist()]
+    
+    def add_node(self, tile):
+        node = self.node_ids.get(tile)
+        if node is None:
+            node = len(self.nodes)
+            self.node_ids[tile] = node
+            self.nodes.append(tile)
+            region = int(self.regions[tile])
+            self.node_regions.append(region)
+            self.edges.append({})
+            self.region_nodes[region].append(node)
+        return node
+    
+    def add_edge(self, node_a, node_b, cost):
+        self.edges[node_a][node_b] = cost
+        self.edges[node_b][node_a] = cost
+    
+    def link_regions(self):
+        """
+        Link the portal tiles inside each region, with one breadth first search out from every portal tile at once
+         - each tile is claimed by the portal tile that reaches it first, without leaving the region
+         - portal tiles whose claimed areas touch are linked by the walk through that border, so the distance
+           between any two portal tiles of a region is a walk through the ones in between
+        :return: None
+        """
+        if not self.nodes:
+            return
+        # a ring of wall round the map keeps every neighbor index on the grid
+        regions = np.pad(self.regions, 1, constant_values=-1).ravel()
+        stride = self.regions.shape[1] + 2
+        owners = np.full(regions.shape, -1, dtype=np.int32)
+        distances = np.zeros(regions.shape, dtype=np.int32)
+        
+        nodes = np.array(self.nodes, dtype=np.int64)
+        frontier = (nodes[:, 0] + 1) * stride + nodes[:, 1] + 1
+        owners[frontier] = np.arange(len(frontier))
+        distance = 0
+        while len(frontier):
+            distance += 1
+            parents = np.tile(frontier, 4)
+            tiles = np.concatenate((frontier - stride, frontier + stride, frontier - 1, frontier + 1))
+            keep = (regions[tiles] == regions[parents]) & (owners[tiles] < 0)
+            tiles, first = np.unique(tiles[keep], return_index=True)
+            owners[tiles] = owners[parents[keep][first]]
+            distances[tiles] = distance
+            frontier = tiles
+        
+        # neighboring tiles of one region claimed by different portal tiles, as node a, node b, cost rows
+        links = []
+        for step in (stride, 1):
+            tiles = np.arange(len(regions) - step)
+            touching = (regions[tiles] >= 0) & (regions[tiles] == regions[tiles + step]) & \
+                       (owners[tiles] != owners[tiles + step])
+            tiles = tiles[touching]
+            links.append(np.stack((owners[tiles], owners[tiles + step],
+                                   distances[tiles] + distances[tiles + step] + 1), axis=1))
+        links = np.concatenate(links)
+        links[:, :2].sort(axis=1)
+        
+        # keep the shortest walk for each pair
+        links = links[np.lexsort((links[:, 2], links[:, 1], links[:, 0]))]
+        first = np.ones(len(links), dtype=bool)
+        first[1:] = (links[1:, 0] != links[:-1, 0]) | (links[1:, 1] != links[:-1, 1])
+        for (node_a, node_b, cost) in links[first].tolist():
+            self.add_edge(node_a, node_b, cost)
+    
+    def get_region(self, x, y):
+        region = self.regions[x, y]
+        if region < 0:
+            return None
+        return int(region)
+    
+    def find_route(self, x, y, target_x, target_y):
+        """
+        Plan a route between regions (Dijkstra over the portal tiles)
+        Distances from the start to its region's portals, and from the target's region's portals to the target,
+        are estimated as straight line steps
+        :param x: start x location
+        :param y: start y location
+        :param target_x: destination x location
+        :param target_y: destination y location
+        :return: list of tuple int x y waypoints ending with the target, or None if there is no route
+        """
+        start_region = self.get_region(x, y)
+        target_region = self.get_region(target_x, target_y)
+        if start_region is None or target_region is None:
+            return None
+        if start_region == target_region:
+            return [(target_x, target_y)]
+        
+        goal = len(self.nodes)
+        distances = {}
+        previous = {}
+        queue = []
+        for node in self.region_nodes[start_region]:
+            (node_x, node_y) = self.nodes[node]
+            distance = abs(node_x - x) + abs(node_y - y)
+            distances[node] = distance
+            previous[node] = None
+            heapq.heappush(queue, (distance, node))
+        
+        while queue:
+            distance, node = heapq.heappop(queue)
+            if node == goal:
+                break
+            if distance > distances[node]:
+                continue
+            neighbors = list(self.edges[node].items())
+            if self.node_regions[node] == target_region:
+                (node_x, node_y) = self.nodes[node]
+                neighbors.append((goal, abs(target_x - node_x) + abs(target_y - node_y)))
+            for neighbor, cost in neighbors:
+                if distance + cost < distances.get(neighbor, float('inf')):
+                    distances[neighbor] = distance + cost
+                    previous[neighbor] = node
+                    heapq.heappush(queue, (distance + cost, neighbor))
+        
+        if goal not in previous:
+            return None
+        route = [(target_x, target_y)]
+        node = previous[goal]
+        while node is not None:
+            route.append(self.nodes[node])
+            node = previous[node]
+        route.reverse()
+        return route
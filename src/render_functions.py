@@ -1,5 +1,6 @@
 from enum import IntEnum
 
+import numpy as np
 import tcod as libtcod
 
 
@@ -9,20 +10,19 @@ class RenderOrder(IntEnum):
     ACTOR = 3
 
 
-def get_names_under_mouse(mouse, entities, fov_map):
+def get_names_under_mouse(mouse, entities, fov_cache):
     (x, y) = (mouse.cx, mouse.cy)
     
-    names = [entity.name for entity in entities
-             if entity.x == x and entity.y == y and libtcod.map_is_in_fov(m=fov_map, x=entity.x, y=entity.y)]
+    names = [entity.name for entity in entities.get_at(x, y) if fov_cache.is_visible(x=entity.x, y=entity.y)]
     names = ', '.join(names)
     
     return names
 
 
-def get_party_under_mouse(mouse, entities, fov_map):
+def get_party_under_mouse(mouse, entities, fov_cache):
     (x, y) = (mouse.cx, mouse.cy)
-    for entity in entities:
-        if entity.x == x and entity.y == y and libtcod.map_is_in_fov(m=fov_map, x=entity.x, y=entity.y) and entity.ai:
+    for entity in entities.get_at(x, y):
+        if fov_cache.is_visible(x=entity.x, y=entity.y) and entity.ai:
             return entity
     return None
 
@@ -53,8 +53,29 @@ def render_member(panel, x, y, member, width, text_color, bkg_color):
                              fmt='({})'.format(member.cooldown))
 
 
-def render_all(con, panel, entities, player, game_map, fov_map, fov_recompute, message_log, screen_width, screen_height,
-               acting_member, bar_width, panel_height, panel_y, mouse, colors, target_tiles=None):
+def draw_tiles(con, mask, char=None, fg=None, bg=None):
+    """
+    Set the character and colors of every map tile in a mask at once
+    :param con: destination drawing console
+    :param mask: 2d boolean array indexed [x][y]
+    :param char: str character to draw, or None to leave it
+    :param fg: color for the character, or None to leave it
+    :param bg: color for the background, or None to leave it
+    :return: None
+    """
+    # console arrays are indexed [y][x]
+    mask = mask.T
+    (height, width) = mask.shape
+    if char is not None:
+        con.ch[:height, :width][mask] = ord(char)
+    if fg is not None:
+        con.fg[:height, :width][mask] = tuple(fg)
+    if bg is not None:
+        con.bg[:height, :width][mask] = tuple(bg)
+
+
+def render_all(con, panel, entities, player, game_map, fov_cache, fov_recompute, message_log, screen_width,
+               screen_height, acting_member, bar_width, panel_height, panel_y, mouse, colors, target_tiles=None):
     """
     Draw all entities in the list
     :param con: destination drawing console
@@ -62,7 +83,7 @@ def render_all(con, panel, entities, player, game_map, fov_map, fov_recompute, m
     :param entities: list of Entity objects
     :param player: the player Entity object
     :param game_map: GameMap object
-    :param fov_map: map of field of view
+    :param fov_cache: FovCache object holding the player's field of view
     :param fov_recompute: boolean
     :param message_log: MessageLog object containing list of messages
     :param screen_width: int width of screen
@@ -73,44 +94,32 @@ def render_all(con, panel, entities, player, game_map, fov_map, fov_recompute, m
     :param panel_y: int location of panel
     :param mouse: tuple mouse location
     :param colors: dict of color tuples
-    :param target_tiles: list of tuple tile coordinates for target tiles to be highlighted
+    :param target_tiles: set of tuple tile coordinates for target tiles to be highlighted
     :return: None
     """
     if fov_recompute:
-        for y in range(game_map.height):
-            for x in range(game_map.width):
-                visible = libtcod.map_is_in_fov(m=fov_map, x=x, y=y)
-                wall = game_map.tiles[x][y].block_sight
-                
-                if visible:
-                    if wall:
-                        libtcod.console_set_char_foreground(con=con, x=x, y=y, col=colors.get('light_ground'))
-                        libtcod.console_set_char(con=con, x=x, y=y, c='-')
-                        libtcod.console_set_char_background(con=con, x=x, y=y, col=colors.get('light_wall'),
-                                                            flag=libtcod.BKGND_SET)
-                    else:
-                        libtcod.console_set_char_foreground(con=con, x=x, y=y, col=colors.get('light_wall'))
-                        libtcod.console_set_char(con=con, x=x, y=y, c='.')
-                        libtcod.console_set_char_background(con=con, x=x, y=y, col=colors.get('light_ground'),
-                                                            flag=libtcod.BKGND_SET)
-                    game_map.tiles[x][y].explored = True
-                elif game_map.tiles[x][y].explored:
-                    if wall:
-                        libtcod.console_set_char(con=con, x=x, y=y, c=' ')
-                        libtcod.console_set_char_background(con=con, x=x, y=y, col=colors.get('dark_wall'),
-                                                            flag=libtcod.BKGND_SET)
-                    else:
-                        libtcod.console_set_char(con=con, x=x, y=y, c=' ')
-                        libtcod.console_set_char_background(con=con, x=x, y=y, col=colors.get('dark_ground'),
-                                                            flag=libtcod.BKGND_SET)
-                if target_tiles and (x, y) in target_tiles:
-                    libtcod.console_set_char_background(con=con, x=x, y=y, col=libtcod.lighter_red,
-                                                        flag=libtcod.BKGND_SET)
+        visible = fov_cache.visible
+        wall = game_map.block_sight
+        remembered = game_map.explored & ~visible
+        
+        draw_tiles(con=con, mask=visible & wall, char='-', fg=colors.get('light_ground'), bg=colors.get('light_wall'))
+        draw_tiles(con=con, mask=visible & ~wall, char='.', fg=colors.get('light_wall'),
+                   bg=colors.get('light_ground'))
+        draw_tiles(con=con, mask=remembered & wall, char=' ', bg=colors.get('dark_wall'))
+        draw_tiles(con=con, mask=remembered & ~wall, char=' ', bg=colors.get('dark_ground'))
+        game_map.explored |= visible
+        
+        if target_tiles:
+            target_mask = np.zeros_like(visible)
+            for (x, y) in target_tiles:
+                if 0 <= x < game_map.width and 0 <= y < game_map.height:
+                    target_mask[x, y] = True
+            draw_tiles(con=con, mask=target_mask, bg=libtcod.lighter_red)
 
     entities_in_render_order = sorted(entities, key=lambda z: z.render_order.value)
     
     for entity in entities_in_render_order:
-        draw_entity(con=con, entity=entity, fov_map=fov_map)
+        draw_entity(con=con, entity=entity, fov_cache=fov_cache)
     
     # noinspection PyTypeChecker
     libtcod.console_blit(src=con, x=0, y=0, w=screen_width, h=screen_height, dst=0, xdst=0, ydst=0)
@@ -129,7 +138,7 @@ def render_all(con, panel, entities, player, game_map, fov_map, fov_recompute, m
     
     # get entities under mouse
     text2 = None
-    text = get_names_under_mouse(mouse=mouse, entities=entities, fov_map=fov_map)
+    text = get_names_under_mouse(mouse=mouse, entities=entities, fov_cache=fov_cache)
     if not text:
         text = player.name
         text2 = 'Gold: {}'.format(player.party.coins)
@@ -139,7 +148,7 @@ def render_all(con, panel, entities, player, game_map, fov_map, fov_recompute, m
         libtcod.console_print_ex(con=panel, x=bar_width, y=0, flag=libtcod.BKGND_NONE, alignment=libtcod.RIGHT,
                                  fmt=text2)
     
-    target = get_party_under_mouse(mouse=mouse, entities=entities, fov_map=fov_map)
+    target = get_party_under_mouse(mouse=mouse, entities=entities, fov_cache=fov_cache)
     if not target:
         target = player
     
@@ -183,15 +192,15 @@ def clear_all(con, entities):
         clear_entity(con=con, entity=entity)
 
 
-def draw_entity(con, entity, fov_map):
+def draw_entity(con, entity, fov_cache):
     """
     Draws a single entity to console
     :param con: destination drawing console
     :param entity: entity object
-    :param fov_map: map of field of view
+    :param fov_cache: FovCache object holding the player's field of view
     :return: None
     """
-    if libtcod.map_is_in_fov(m=fov_map, x=entity.x, y=entity.y):
+    if fov_cache.is_visible(x=entity.x, y=entity.y):
         libtcod.console_set_default_foreground(con=con, col=entity.color)
         libtcod.console_put_char(con=con, x=entity.x, y=entity.y, c=entity.char, flag=libtcod.BKGND_NONE)
 
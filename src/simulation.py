@@ -0,0 +1,437 @@
+import random
+import time
+
+import tcod as libtcod
+
+from src.activity import ActivityScheduler
+from src.attack_types import get_target_tiles, directions
+from src.components.ai import take_turns
+from src.components.party import Party, PartyMember
+from src.death_functions import kill_monster, kill_player
+from src.entity import Entity, EntityList, get_blocking_entities_at_location
+from src.fov_functions import initialize_fov, FovCache, Perception
+from src.game_clock import game_clock
+from src.game_messages import MessageLog, Message
+from src.game_states import GameStates
+from src.map_objects.caverns import distance_to
+from src.map_objects.game_map import GameMap
+from src.render_functions import RenderOrder
+from src.turn_scheduler import TurnScheduler, get_action_delay
+
+MOVES = [(0, -1), (0, 1), (-1, 0), (1, 0)]
+
+
+def create_player():
+    """
+    :return: player Entity object, with the starting party
+    """
+    party_component = Party()
+    member_1 = PartyMember(name="Bill", profession="Soldier", offensive_cd=4, defensive_cd=4,
+                           attack_type={'line': 1}, cost=5)
+    member_2 = PartyMember(name="John", profession="Archer", offensive_cd=5, defensive_cd=5,
+                           attack_type={'direct': 4}, cost=4)
+    member_3 = PartyMember(name="Sam", profession="Defender", offensive_cd=5, defensive_cd=3,
+                           attack_type={'line': 1}, cost=5)
+    member_4 = PartyMember(name="Ivan", profession="Ice Mage", offensive_cd=6, defensive_cd=6,
+                           attack_type={'cone': 3}, cost=8)
+    party_component.add_member(member_1)
+    party_component.add_member(member_2)
+    party_component.add_member(member_3)
+    party_component.add_member(member_4)
+    return Entity(x=0, y=0, char='@', color=libtcod.white, name='Hero Party', blocks=True,
+                  render_order=RenderOrder.ACTOR, party=party_component)
+
+
+class Simulation:
+    def __init__(self, player, entities, game_map, message_log, fov_radius, monster_sight_radius, wake_radius,
+                 sleep_radius, noise_radius, max_monsters_per_room):
+        """
+        The game's turn logic, with no window attached: player action -> results -> enemy turn -> cooldown ticks
+        engine.main feeds it key presses and draws the result; run_game feeds it an action source instead
+        :param player: player Entity object, already placed on the map
+        :param entities: EntityList of Entity objects
+        :param game_map: GameMap object, already filled
+        :param message_log: MessageLog object
+        :param fov_radius: int distance the player can see
+        :param monster_sight_radius: int longest distance any monster can see the player from
+        :param wake_radius: int distance monsters wake within
+        :param sleep_radius: int distance awake monsters fall dormant beyond
+        :param noise_radius: int distance the noise of a fight carries
+        :param max_monsters_per_room: int maximum number of monsters per zone (for chunks generated while exploring)
+        """
+        self.player = player
+        self.entities = entities
+        self.game_map = game_map
+        self.message_log = message_log
+        self.fov_radius = fov_radius
+        self.noise_radius = noise_radius
+        self.max_monsters_per_room = max_monsters_per_room
+        
+        self.fov_recompute = True
+        self.fov_map = initialize_fov(game_map=game_map)
+        self.fov_cache = FovCache(fov_map=self.fov_map, game_map=game_map)
+        self.perception = Perception(game_map=game_map, radius=monster_sight_radius)
+        entities.set_navigation(game_map.navigation)
+        self.turn_scheduler = TurnScheduler()
+        self.last_turn = self.turn_scheduler.turn
+        self.activity = ActivityScheduler(wake_radius=wake_radius, sleep_radius=sleep_radius,
+                                          turn_scheduler=self.turn_scheduler)
+        
+        self.game_state = GameStates.PLAYER_TURN
+        self.previous_member = None
+        self.target_tiles = None
+        # every non-empty action taken, so a game can be replayed (see ReplayActions)
+        self.actions = []
+    
+    @property
+    def turn(self):
+        return self.turn_scheduler.turn
+    
+    def compute_fov(self):
+        if self.fov_recompute:
+            self.fov_cache.compute(x=self.player.x, y=self.player.y, radius=self.fov_radius)
+    
+    def get_outcome(self):
+        """
+        :return: str 'dead' or 'cleared' (no monsters left) if the game is over, else None
+        """
+        if self.game_state == GameStates.PLAYER_DEAD:
+            return 'dead'
+        if not any(entity.ai for entity in self.entities):
+            return 'cleared'
+        return None
+    
+    def take_action(self, action):
+        """
+        Play one player input through: the player's action and its results, then the enemy turn if the action
+        used up the player's turn
+        :param action: dict from handle_keys or an action source, e.g. {'move': (0, 1)}
+        :return: None
+        """
+        if action:
+            self.actions.append(action)
+        self.compute_fov()
+        self.process_results(self.play_player_turn(action))
+        if self.game_state == GameStates.ENEMY_TURN:
+            self.play_enemy_turn()
+    
+    def play_player_turn(self, action):
+        """
+        :param action: dict of player input
+        :return: list of result dicts
+        """
+        player = self.player
+        entities = self.entities
+        game_map = self.game_map
+        
+        move = action.get('move')
+        auto = action.get('auto')
+        selected_member = action.get('member')
+        act_dir = action.get('act_dir')
+        
+        player_turn_results = []
+        
+        # AUTOMATIC -----------------------------------------
+        if auto and GameStates.PLAYER_TURN:
+            for entity in entities.get_at(player.x, player.y):
+                if not entity.ai and not entity.blocks and entity.party.members:
+                    player_turn_results.append({'add_member': entity})
+                elif not entity.ai and not entity.blocks and entity.party.coins:
+                    player_turn_results.append({'loot_coins': entity})
+            else:  # Wait
+                self.game_state = GameStates.ENEMY_TURN
+        
+        # MOVEMENT ------------------------------------------
+        if move and self.game_state == GameStates.PLAYER_TURN:
+            dx, dy = move
+            destination_x = player.x + dx
+            destination_y = player.y + dy
+            
+            if not game_map.is_blocked(x=destination_x, y=destination_y) \
+                    and not get_blocking_entities_at_location(entities=entities, x=destination_x, y=destination_y):
+                player.move(dx=dx, dy=dy)
+                self.fov_recompute = True
+                
+                if game_map.world:
+                    # new chunks reach the fov map through its tile listener
+                    game_map.update_chunks(player=player, entities=entities,
+                                           max_monsters_per_room=self.max_monsters_per_room)
+                self.game_state = GameStates.ENEMY_TURN
+        
+        # SELECTED MEMBER -----------------------------------
+        if selected_member and selected_member <= len(player.party.members) and \
+                player.party.members[selected_member - 1].cooldown < 1:
+            if not self.previous_member:
+                self.previous_member = selected_member
+                self.target_tiles = get_target_tiles(entity=player, member=self.previous_member - 1,
+                                                     game_map=game_map, fov_cache=self.fov_cache)
+                player_turn_results.append({'message': Message("Direction?")})
+                self.game_state = GameStates.TARGETING
+            
+            elif self.previous_member == selected_member:
+                self.previous_member = None
+                self.target_tiles = None
+                self.game_state = GameStates.PLAYER_TURN
+        
+        if act_dir and self.previous_member and self.game_state == GameStates.TARGETING:
+            member = player.party.members[self.previous_member - 1]
+            attack_tiles = get_target_tiles(entity=player, member=self.previous_member - 1, game_map=game_map,
+                                            fov_cache=self.fov_cache, attack_dir=[act_dir])
+            targets = [entity for (x, y) in attack_tiles for entity in entities.get_at(x, y) if entity.ai]
+            
+            # TODO this code should really be somewhere else...
+            if targets:
+                self.activity.make_noise(x=player.x, y=player.y, radius=self.noise_radius, entities=entities)
+                if member.attack_type.get('line'):
+                    for target in targets:
+                        player_turn_results.extend(member.attack(target=target))
+                elif member.attack_type.get('direct'):
+                    closest = targets[0]
+                    closest_dist = distance_to(player.x, closest.x, player.y, closest.y)
+                    targets.remove(closest)
+                    for target in targets:
+                        distance = distance_to(player.x, player.y, target.x, target.y)
+                        if distance < closest_dist:
+                            closest = target
+                            closest_dist = distance
+                    player_turn_results.extend(member.attack(target=closest))
+                elif member.attack_type.get('cone'):
+                    for target in targets:
+                        player_turn_results.extend(member.attack(target=target))
+            
+            else:
+                player_turn_results.append({'message': Message("Attack hits nothing")})
+            self.previous_member = None
+            self.target_tiles = None
+            self.game_state = GameStates.ENEMY_TURN
+        
+        return player_turn_results
+    
+    def process_results(self, results):
+        """
+        Apply the results of a turn, stopping if the player dies
+        :param results: list of result dicts
+        :return: None
+        """
+        player = self.player
+        for result in results:
+            rescued_members = result.get('add_member')
+            message = result.get('message')
+            dead_entity = result.get('dead')
+            loot_coins = result.get('loot_coins')
+            
+            if rescued_members:
+                for member in rescued_members.party.members:
+                    msg, res = player.party.add_member(member)
+                    self.message_log.add_message(msg)
+                    if res:
+                        self.entities.remove(rescued_members)
+            
+            if loot_coins:
+                msg = player.party.add_coins(loot_coins.party.coins)
+                self.message_log.add_message(msg)
+                self.entities.remove(loot_coins)
+            
+            if message:
+                self.message_log.add_message(message=message)
+            
+            if dead_entity:
+                if dead_entity == player:
+                    message, self.game_state = kill_player(player=dead_entity)
+                else:
+                    message = kill_monster(entity=dead_entity)
+                
+                self.message_log.add_message(message=message)
+                
+                if self.game_state == GameStates.PLAYER_DEAD:
+                    break
+    
+    def play_enemy_turn(self):
+        """
+        Every awake monster whose action comes up before the player's next one takes its turn (monsters acting at
+        the same moment go together, see take_turns), then cooldowns tick for the game time that has passed
+        :return: None
+        """
+        player = self.player
+        # monsters that wake up are queued first, then the player's next action after its own delay
+        self.activity.update(player=player, entities=self.entities)
+        self.turn_scheduler.schedule(player, get_action_delay(player))
+        if self.game_map.chase_monsters:
+            self.game_map.chase_map.update(player.x, player.y)
+        self.perception.update(player.x, player.y)
+        
+        # every monster whose action comes up before the player's next one, a moment of game time at a time
+        batch = self.turn_scheduler.pop_batch(stop=player)
+        while batch:
+            monsters = [entity for entity in batch if entity.ai]
+            enemy_turn_results = take_turns(monsters=monsters, target=player, perception=self.perception,
+                                            game_map=self.game_map, entities=self.entities)
+            for monster in monsters:
+                self.turn_scheduler.schedule(monster, get_action_delay(monster))
+            self.process_results(enemy_turn_results)
+            
+            if self.game_state == GameStates.PLAYER_DEAD:
+                return
+            batch = self.turn_scheduler.pop_batch(stop=player)
+        self.turn_scheduler.pop()
+        
+        self.game_state = GameStates.PLAYER_TURN
+        # tick every cooldown once for every whole turn of game time that has passed
+        game_clock.advance(self.turn_scheduler.turn - self.last_turn)
+        self.last_turn = self.turn_scheduler.turn
+
+
+class RandomActions:
+    def __init__(self, seed=None):
+        """
+        Action source that mashes keys: random moves, waits and attacks in random directions
+        :param seed: int seed for its own random sequence, separate from the game's
+        """
+        self.random = random.Random(seed)
+    
+    def get_action(self, simulation):
+        if simulation.game_state == GameStates.TARGETING:
+            return {'act_dir': self.random.choice(directions)}
+        roll = self.random.random()
+        if roll < 0.2:
+            return {'member': self.random.randint(1, len(simulation.player.party.members))}
+        elif roll < 0.25:
+            return {'auto': True}
+        return {'move': self.random.choice(MOVES)}
+
+
+class ScriptedActions:
+    def __init__(self, seed=None):
+        """
+        Action source that plays like a (simple-minded) person would:
+         - attack with the first ready member that would hit a monster
+         - pick up heroes and coins it is standing on
+         - otherwise walk towards the closest monster, hero or coins, or wander if nothing can be reached
+        :param seed: int seed for wandering
+        """
+        self.random = random.Random(seed)
+        self.direction = None
+    
+    def get_action(self, simulation):
+        player = simulation.player
+        entities = simulation.entities
+        if simulation.game_state == GameStates.TARGETING:
+            return {'act_dir': self.direction}
+        
+        for index, member in enumerate(player.party.members):
+            if member.cooldown < 1:
+                for direction in directions:
+                    attack_tiles = get_target_tiles(entity=player, member=index, game_map=simulation.game_map,
+                                                    fov_cache=simulation.fov_cache, attack_dir=[direction])
+                    if any(entity.ai for (x, y) in attack_tiles for entity in entities.get_at(x, y)):
+                        self.direction = direction
+                        return {'member': index + 1}
+        
+        if any(not entity.ai and not entity.blocks and entity.party and (entity.party.members or entity.party.coins)
+               for entity in entities.get_at(player.x, player.y)):
+            return {'auto': True}
+        
+        goals = [entity for entity in entities if entity is not player and entity.party and
+                 (entity.ai or entity.party.members or entity.party.coins)]
+        if goals:
+            goal = min(goals, key=player.distance_to)
+            steps = simulation.game_map.navigation.compute_path(player.x, player.y, goal.x, goal.y)
+            if steps and get_blocking_entities_at_location(entities=entities, x=steps[0][0], y=steps[0][1]):
+                # next to a monster with nobody ready to attack it, or one is standing on the loot
+                return {'auto': True}
+            elif steps:
+                (x, y) = steps[0]
+                return {'move': (x - player.x, y - player.y)}
+        if self.random.random() < 0.1:
+            return {'auto': True}
+        return {'move': self.random.choice(MOVES)}
+
+
+class ReplayActions:
+    def __init__(self, actions):
+        """
+        Action source that plays back the actions of an earlier game (Simulation.actions)
+        :param actions: list of action dicts
+        """
+        self.actions = iter(actions)
+    
+    def get_action(self, simulation):
+        """
+        :return: dict next action, or None once the recording runs out
+        """
+        action = next(self.actions, None)
+        if action is not None:
+            # JSON turns tuples into lists
+            action = {key: tuple(value) if isinstance(value, list) else value for key, value in action.items()}
+        return action
+
+
+ACTION_SOURCES = {
+    'random': RandomActions,
+    'scripted': ScriptedActions,
+}
+
+
+def new_game(seed, map_width=80, map_height=43, survive_min=3, survive_max=7, resurrect_min=6, resurrect_max=6,
+             iterations=4, zone_seed_min_distance=10, min_cavern_size=15, max_monsters_per_room=3,
+             chase_monsters=False, fov_radius=8, monster_sight_radius=8, noise_radius=10):
+    """
+    Set up a headless game, with the same settings engine.main uses by default
+    :param seed: int seed for both the level and the game's random sequence, so the same seed plays the same game
+    :return: Simulation object
+    """
+    random.seed(seed)
+    player = create_player()
+    entities = EntityList([player])
+    game_map = GameMap(width=map_width, height=map_height, chase_monsters=chase_monsters)
+    game_map.make_map(survive_min=survive_min, survive_max=survive_max, resurrect_min=resurrect_min,
+                      resurrect_max=resurrect_max, iterations=iterations,
+                      zone_seed_min_distance=zone_seed_min_distance, min_cavern_size=min_cavern_size, player=player,
+                      entities=entities, max_monsters_per_room=max_monsters_per_room, seed=seed)
+    message_log = MessageLog(x=0, width=map_width, height=10)
+    return Simulation(player=player, entities=entities, game_map=game_map, message_log=message_log,
+                      fov_radius=fov_radius, monster_sight_radius=monster_sight_radius,
+                      wake_radius=monster_sight_radius, sleep_radius=2 * monster_sight_radius,
+                      noise_radius=noise_radius, max_monsters_per_room=max_monsters_per_room)
+
+
+def run_game(seed, source='scripted', max_turns=2000, replay=None, record=False):
+    """
+    Play one headless game to the end: the party dies, every monster is dead, or max_turns pass
+    (a process pool entry point, so it only takes and returns plain data)
+    :param seed: int game seed (see new_game)
+    :param source: str name of an ACTION_SOURCES entry
+    :param max_turns: int number of turns before the game is called a timeout
+    :param replay: list of action dicts to play back instead of using source, or None
+    :param record: boolean, include the actions taken in the result
+    :return: dict of seed, outcome, turns, actions, seconds (and the recorded actions if asked for)
+    """
+    simulation = new_game(seed=seed)
+    if replay is not None:
+        action_source = ReplayActions(actions=replay)
+    else:
+        action_source = ACTION_SOURCES[source](seed=seed)
+    # actions that don't use up a turn (like a member on cooldown) still count, so a stuck source ends too
+    max_actions = max_turns * 10
+    
+    outcome = None
+    action_count = 0
+    start = time.perf_counter()
+    while outcome is None:
+        if simulation.turn >= max_turns or action_count >= max_actions:
+            outcome = 'timeout'
+            break
+        action = action_source.get_action(simulation)
+        if action is None:
+            outcome = 'replay ended'
+            break
+        simulation.take_action(action)
+        action_count += 1
+        outcome = simulation.get_outcome()
+    seconds = time.perf_counter() - start
+    
+    result = {'seed': seed, 'outcome': outcome, 'turns': simulation.turn, 'actions': action_count,
+              'seconds': seconds, 'party_size': len(simulation.player.party.members)}
+    if record:
+        result['recording'] = simulation.actions
+    return result
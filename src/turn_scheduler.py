@@ -0,0 +1,94 @@
+import heapq
+from itertools import count
+
+# game time for one action at normal speed (speed 100)
+TURN_LENGTH = 100
+
+
+def get_action_delay(entity):
+    """
+    :param entity: Entity object
+    :return: int game time until the entity's next action, shorter for faster entities
+    """
+    return max(1, TURN_LENGTH * 100 // entity.speed)
+
+
+class TurnScheduler:
+    def __init__(self):
+        """
+        Decides who acts next: a heap of actors keyed by the game time of their next action
+        Scheduling and popping an actor cost O(log n), however many actors there are
+        Actors scheduled for the same time act in the order they were scheduled
+        """
+        self.time = 0
+        self.queue = []
+        self.order = count()
+        # actor -> order number of its live entry in the queue (entries for unscheduled actors are skipped when popped)
+        self.entries = {}
+    
+    def __contains__(self, actor):
+        return actor in self.entries
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    @property
+    def turn(self):
+        """
+        :return: int number of whole turns of game time that have passed
+        """
+        return self.time // TURN_LENGTH
+    
+    def schedule(self, actor, delay):
+        """
+        Queue an actor's next action (replacing any action it already had queued)
+        :param actor: Entity object
+        :param delay: int game time from now until it acts
+        :return: None
+        """
+        order = next(self.order)
+        self.entries[actor] = order
+        heapq.heappush(self.queue, (self.time + delay, order, actor))
+    
+    def unschedule(self, actor):
+        self.entries.pop(actor, None)
+    
+    def pop(self):
+        """
+        Take the next actor off the queue, moving the game time forward to its action
+        :return: Entity object, or None if nobody is scheduled
+        """
+        while self.queue:
+            (time, order, actor) = heapq.heappop(self.queue)
+            if self.entries.get(actor) == order:
+                del self.entries[actor]
+                self.time = time
+                return actor
+        return None
+    
+    def peek(self):
+        """
+        :return: (int game time, Entity object) of the next actor, without taking it off the queue, or None
+        """
+        while self.queue:
+            (time, order, actor) = self.queue[0]
+            if self.entries.get(actor) == order:
+                return time, actor
+            heapq.heappop(self.queue)
+        return None
+    
+    def pop_batch(self, stop=None):
+        """
+        Take every actor whose action comes up at the next game time off the queue, in order
+        :param stop: actor to leave on the queue, along with everyone after it (the player, usually)
+        :return: list of Entity objects, empty if stop (or nobody) is next
+        """
+        batch = []
+        first = self.peek()
+        while first is not None:
+            (time, actor) = first
+            if actor is stop or batch and time != self.time:
+                break
+            batch.append(self.pop())
+            first = self.peek()
+        return batch